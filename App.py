@@ -1,5 +1,5 @@
 import streamlit as st
-from dashboards import init_da_state, show_dashboard
+from dashboards import init_da_state, show_dashboard, warm_up
 import base64
 
 
@@ -150,6 +150,8 @@ def main():
     if not st.session_state.logged_in:
         login_screen()
         init_da_state()
+        # the login page is already painted; load the engine behind it
+        warm_up()
         st.stop()   # IMPORTANT: Stops rendering anything below
 
     # Logged in → Show dashboard
@@ -4,76 +4,165 @@ High-level helper functions for dashboards.
 Builds on top of data_pipeline.py.
 """
 
-from typing import Tuple, Dict, Optional
+import datetime
+import logging
+import os
+import pickle
+import time
+from typing import Tuple, Dict, List, Optional
+import numpy as np
 import pandas as pd
 
-from data_pipeline import load_and_cluster_data
-
-_df_cache: Optional[pd.DataFrame] = None
-_model_cache = None
-
-
-
-def refresh_data(force: bool = False) -> Tuple[pd.DataFrame, object]:
+import eda_profile
+import metrics
+import plot_data
+import snapshot_store
+import table_view
+import view_models
+from engine_cache import EngineCache, EngineSnapshot, Memo
+from refresh_scheduler import (
+    REFRESH_INTERVAL,
+    REFRESH_MODE,
+    RefreshScheduler,
+    snapshot_token,
+    source_token,
+)
+
+CACHE_TTL = float(os.getenv("MARKETPULSE_CACHE_TTL", "900"))
+
+SEGMENT_STATS = ["sum", "mean", "min", "max"]
+
+SEGMENT_MAP = {
+    0: "High Value",
+    1: "Medium Value",
+    2: "Low Value",
+    3: "At Risk",
+}
+
+
+class SegmentCube:
     """
-    Load + clean + cluster the data.
-    Uses a small cache to avoid hitting SQL multiple times.
+    Per-cluster aggregates built in one pass at refresh time.
+    `clusters` has one row per Cluster with a `Count` column plus
+    `<measure>_<stat>` columns for every numeric measure; `totals` holds the
+    same measures over all customers. Getters read from here instead of
+    grouping the full frame on every rerun.
     """
-    global _df_cache, _model_cache
-
-    if force or _df_cache is None:
-        df, model = load_and_cluster_data()
-        _df_cache = df
-        _model_cache = model
-
-    return _df_cache, _model_cache
 
+    def __init__(self, df: pd.DataFrame):
+        measures = [
+            c for c in df.select_dtypes(include="number").columns if c != "Cluster"
+        ]
+        self.measures = measures
+        self.total_count = int(len(df))
+
+        if "Cluster" in df.columns and len(df):
+            self.clusters = self._aggregate(df, measures)
+        else:
+            self.clusters = pd.DataFrame(
+                columns=["Count"] + [f"{m}_{stat}" for m in measures for stat in SEGMENT_STATS]
+            )
+
+        # global totals, rolled up from the per-cluster rows
+        c = self.clusters
+        self.totals: Dict[str, float] = {}
+        for m in measures:
+            if f"{m}_sum" not in c or c.empty:
+                continue
+            total = float(c[f"{m}_sum"].sum())
+            self.totals[f"{m}_sum"] = total
+            self.totals[f"{m}_mean"] = total / self.total_count if self.total_count else 0.0
+            self.totals[f"{m}_min"] = float(c[f"{m}_min"].min())
+            self.totals[f"{m}_max"] = float(c[f"{m}_max"].max())
+
+    def has(self, measure: str) -> bool:
+        return measure in self.measures
+
+    @staticmethod
+    def _aggregate(df: pd.DataFrame, measures: List[str]) -> pd.DataFrame:
+        """
+        One row per Cluster. Sums (and so means) are accumulated in float64 one
+        column at a time: most measures are float32, whose sums drift by
+        dollars at millions of rows. Min and max are exact in any dtype.
+        """
+        codes, clusters = pd.factorize(df["Cluster"], sort=True)
+        valid = codes >= 0
+        if valid.all():
+            valid = slice(None)
+        codes, k = codes[valid], len(clusters)
+        extremes = df.groupby("Cluster")[measures].agg(["min", "max"])
+
+        sizes = np.bincount(codes, minlength=k)
+        columns = {"Count": sizes}
+        for m in measures:
+            values = df[m].to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+            missing = np.isnan(values)
+            if missing.any():
+                present = ~missing
+                total = np.bincount(codes[present], values[present], minlength=k)
+                count = np.bincount(codes[present], minlength=k)
+            else:
+                total, count = np.bincount(codes, values, minlength=k), sizes
+            columns[f"{m}_sum"] = total
+            columns[f"{m}_mean"] = np.divide(total, count, out=np.full(k, np.nan), where=count > 0)
+            columns[f"{m}_min"] = extremes[(m, "min")].to_numpy()
+            columns[f"{m}_max"] = extremes[(m, "max")].to_numpy()
+
+        index = pd.Index(clusters, name="Cluster")
+        return pd.DataFrame(columns, index=index)
+
+
+def segment_labels(clusters: pd.Series) -> pd.Categorical:
+    """
+    Segment label per row as a categorical built straight from the integer
+    Cluster codes (no per-row string mapping). Unknown clusters become NaN.
+    """
+    codes = clusters.to_numpy()
+    codes = np.where((codes >= 0) & (codes < len(SEGMENT_MAP)), codes, -1)
+    categories = [SEGMENT_MAP[k] for k in range(len(SEGMENT_MAP))]
+    return pd.Categorical.from_codes(codes, categories=categories)
 
-def get_df() -> pd.DataFrame:
-    """Return latest dataframe with Cluster column."""
-    df, _ = refresh_data()
-    return df
 
-def get_cluster_summary() -> pd.DataFrame:
+# ---------------------------------------------------------
+#   METRICS OVER THE CUBE
+# ---------------------------------------------------------
+# Pure functions of one snapshot's cube: the getters below apply them to the
+# current snapshot, and _build_views() to the one being loaded.
+def _segment_rows(cube: SegmentCube) -> pd.DataFrame:
     """
-    Summary for clusters:
-    Cluster | Count | AvgIncome | AvgTotalSpend | AvgRecency
+    Per-cluster aggregates with the Segment label applied to the (few) grouped
+    rows. Clusters map one-to-one to segments, so no regrouping is needed.
     """
-    df = get_df()
+    rows = cube.clusters.reset_index()
+    rows.insert(0, "Segment", rows["Cluster"].map(SEGMENT_MAP))
+    return rows.dropna(subset=["Segment"])
+
 
-    if "Cluster" not in df.columns:
+def _cluster_summary(cube: SegmentCube) -> pd.DataFrame:
+    if cube.clusters.empty:
         return pd.DataFrame(
             columns=["Cluster", "Count", "AvgIncome", "AvgTotalSpend", "AvgRecency"]
         )
 
-    summary = (
-        df.groupby("Cluster", as_index=False)
-        .agg(
-            Count=("Cluster", "size"),
-            AvgIncome=("Income", "mean") if "Income" in df.columns else ("Cluster", "size"),
-            AvgTotalSpend=("TotalSpend", "mean") if "TotalSpend" in df.columns else ("Cluster", "size"),
-            AvgRecency=("Recency", "mean") if "Recency" in df.columns else ("Cluster", "size"),
-        )
-    )
+    c = cube.clusters
+    summary = pd.DataFrame({
+        "Cluster": c.index,
+        "Count": c["Count"].to_numpy(),
+        "AvgIncome": (c["Income_mean"] if cube.has("Income") else c["Count"]).to_numpy(),
+        "AvgTotalSpend": (c["TotalSpend_mean"] if cube.has("TotalSpend") else c["Count"]).to_numpy(),
+        "AvgRecency": (c["Recency_mean"] if cube.has("Recency") else c["Count"]).to_numpy(),
+    })
 
     return summary
 
 
+def _manager_kpis(cube: SegmentCube) -> Dict[str, float]:
+    totals = cube.totals
 
-# ---------------------------------------------------------
-#   MANAGER DASHBOARD METRICS
-# ---------------------------------------------------------
-def get_manager_kpis() -> Dict[str, float]:
-    df = get_df()
-
-    total_customers = len(df)
-    avg_spend = float(df["TotalSpend"].mean()) if "TotalSpend" in df else 0
-    total_revenue = float(df["TotalSpend"].sum()) if "TotalSpend" in df else 0
-
-    if "AcceptedAnyCampaign" in df:
-        campaign_rate = float(df["AcceptedAnyCampaign"].mean())
-    else:
-        campaign_rate = 0.0
+    total_customers = cube.total_count
+    avg_spend = totals.get("TotalSpend_mean", 0.0)
+    total_revenue = totals.get("TotalSpend_sum", 0.0)
+    campaign_rate = totals.get("AcceptedAnyCampaign_mean", 0.0)
 
     return {
         "total_customers": total_customers,
@@ -83,77 +172,347 @@ def get_manager_kpis() -> Dict[str, float]:
     }
 
 
-def get_revenue_by_segment() -> pd.DataFrame:
-    df = get_df()
-
-    if "Cluster" not in df or "TotalSpend" not in df:
+def _revenue_by_segment(cube: SegmentCube) -> pd.DataFrame:
+    if cube.clusters.empty or not cube.has("TotalSpend"):
         return pd.DataFrame(columns=["Segment", "Revenue"])
 
-    segment_map = {
-        0: "High Value",
-        1: "Medium Value",
-        2: "Low Value",
-        3: "At Risk",
-    }
-
-    tmp = df.copy()
-    tmp["Segment"] = tmp["Cluster"].map(segment_map)
+    rows = _segment_rows(cube)
 
     return (
-        tmp.groupby("Segment", as_index=False)
-        .agg(Revenue=("TotalSpend", "sum"))
+        pd.DataFrame({"Segment": rows["Segment"], "Revenue": rows["TotalSpend_sum"]})
         .sort_values("Revenue", ascending=False)
     )
 
 
+def _segment_distribution(cube: SegmentCube) -> pd.DataFrame:
+    if cube.clusters.empty:
+        return pd.DataFrame(columns=["Segment", "CustomerCount"])
+
+    rows = _segment_rows(cube)
+
+    return (
+        pd.DataFrame({"Segment": rows["Segment"], "CustomerCount": rows["Count"]})
+        .sort_values("CustomerCount", ascending=False)
+    )
+
+
+def _segment_spend_table(cube: SegmentCube) -> pd.DataFrame:
+    if cube.clusters.empty or not cube.has("TotalSpend"):
+        return pd.DataFrame(columns=["Segment", "CustomerCount", "AverageSpend", "TotalRevenue"])
+
+    rows = _segment_rows(cube)
+
+    return (
+        pd.DataFrame({
+            "Segment": rows["Segment"],
+            "CustomerCount": rows["Count"],
+            "AverageSpend": rows["TotalSpend_mean"],
+            "TotalRevenue": rows["TotalSpend_sum"],
+        })
+        .sort_values("TotalRevenue", ascending=False)
+    )
+
+
 # ---------------------------------------------------------
-#   DATA ANALYST DASHBOARD METRICS
+#   VIEW MODELS
 # ---------------------------------------------------------
-def get_segment_distribution() -> pd.DataFrame:
-    df = get_df()
+SCATTER_COLUMNS = ["Income", "TotalSpend", "Segment"]
+SAMPLE_TABLE_COLUMNS = ["ID", "Income", "Age", "TotalSpend", "TotalPurchases", "Recency", "Cluster", "Segment"]
 
-    if "Cluster" not in df:
-        return pd.DataFrame(columns=["Segment", "CustomerCount"])
 
-    segment_map = {
-        0: "High Value",
-        1: "Medium Value",
-        2: "Low Value",
-        3: "At Risk",
-    }
+def _profile(snapshot: EngineSnapshot) -> eda_profile.DatasetProfile:
+    """The snapshot's dataset profile, built on first use."""
+    def build():
+        with metrics.stage("eda_profile") as s:
+            profile = eda_profile.DatasetProfile(snapshot.df, snapshot.version)
+            s.rows, s.cols = profile.rows, profile.cols
+        return profile
 
-    tmp = df.copy()
-    tmp["Segment"] = tmp["Cluster"].map(segment_map)
+    return snapshot.memo.get("eda_profile", build)
 
-    return (
-        tmp.groupby("Segment", as_index=False)
-        .agg(CustomerCount=("Segment", "size"))
-        .sort_values("CustomerCount", ascending=False)
+
+def _sample(snapshot: EngineSnapshot, by: str, n: int,
+            columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Stratified sample of the snapshot's frame by `by`; the positions are drawn once."""
+    positions = snapshot.memo.get(
+        ("sample", by, n), lambda: plot_data.stratified_positions(snapshot.df[by], n)
     )
+    rows = snapshot.df.iloc[positions]
+    return rows[columns] if columns else rows
 
 
-def get_segment_spend_table() -> pd.DataFrame:
-    df = get_df()
+def _build_views(snapshot: EngineSnapshot) -> Dict[str, object]:
+    """Every role's view model for one snapshot (see view_models.py)."""
+    df, cube, version = snapshot.df, snapshot.cube, snapshot.version
+    kpis = _manager_kpis(cube)
+    segment_distribution = _segment_distribution(cube)
 
-    if "Cluster" not in df or "TotalSpend" not in df:
-        return pd.DataFrame(columns=["Segment", "CustomerCount", "AverageSpend", "TotalRevenue"])
+    # also warms the profile, whose column distributions the report computes on demand
+    profile = _profile(snapshot)
+    sample = None
+    if set(SCATTER_COLUMNS) <= set(df.columns):
+        sample = _sample(snapshot, "Segment", plot_data.SAMPLE_POINTS, SCATTER_COLUMNS)
+        sample = sample.astype({"Segment": str}).reset_index(drop=True)
 
-    segment_map = {
-        0: "High Value",
-        1: "Medium Value",
-        2: "Low Value",
-        3: "At Risk",
+    return {
+        view_models.MANAGER: view_models.ManagerView(
+            version=version,
+            total_customers=kpis["total_customers"],
+            avg_customer_spend=kpis["avg_customer_spend"],
+            total_revenue=kpis["total_revenue"],
+            accepted_campaign_rate=kpis["accepted_campaign_rate"],
+            revenue_by_segment=_revenue_by_segment(cube),
+        ),
+        view_models.MARKETING_ANALYST: view_models.MarketingView(
+            version=version,
+            segment_distribution=segment_distribution,
+        ),
+        view_models.DATA_ANALYST: view_models.DataAnalystView(
+            version=version,
+            rows=len(df),
+            columns=list(df.columns),
+            segment_distribution=segment_distribution,
+            spend_table=_segment_spend_table(cube),
+            cluster_summary=_cluster_summary(cube),
+            cluster_counts=cube.clusters["Count"].copy(),
+            sample=sample,
+            sample_columns=[c for c in SAMPLE_TABLE_COLUMNS if c in df.columns],
+            head=df.head(view_models.PREVIEW_ROWS).copy(),
+            tail=df.tail(view_models.PREVIEW_ROWS).copy(),
+            summary=profile.summary(),
+            missing=profile.missing_table(),
+            dtypes=profile.dtypes,
+            corr=profile.corr,
+        ),
     }
 
-    tmp = df.copy()
-    tmp["Segment"] = tmp["Cluster"].map(segment_map)
 
-    return (
-        tmp.groupby("Segment", as_index=False)
-        .agg(
-            CustomerCount=("Segment", "size"),
-            AverageSpend=("TotalSpend", "mean"),
-            TotalRevenue=("TotalSpend", "sum"),
+def _views_for(snapshot: EngineSnapshot, fingerprint: Optional[str]) -> Dict[str, object]:
+    """
+    View models for this snapshot: loaded from the snapshot directory when
+    another process already built them for the same data, else built (and
+    saved for the others).
+    """
+    if fingerprint:
+        views = snapshot_store.load_views(fingerprint)
+        if views is not None:
+            return views
+
+    with metrics.stage("view_models"):
+        views = _build_views(snapshot)
+    if fingerprint:
+        try:
+            snapshot_store.save_views(views, fingerprint)
+        except (OSError, pickle.PicklingError) as e:
+            logging.warning("Could not save view models: %s", e)
+    return views
+
+
+def _change_token() -> str:
+    """
+    The source's cheap change token plus today's date (Age and
+    Customer_Tenure depend on it): metadata only, where the fingerprint
+    needs a checksum scan of the table.
+    """
+    return f"{source_token()}|{datetime.date.today()}"
+
+
+def _make_snapshot(df: pd.DataFrame, model: object, fingerprint: Optional[str],
+                   token: Optional[str] = None) -> EngineSnapshot:
+    """Segment labels, aggregates and view models for a freshly loaded frame."""
+    if "Cluster" in df.columns:
+        df["Segment"] = segment_labels(df["Cluster"])
+
+    loaded_at = time.time()
+    version = fingerprint[:12] if fingerprint else f"t{int(loaded_at)}"
+
+    snapshot = EngineSnapshot(df, model, SegmentCube(df), version, loaded_at, token=token, memo=Memo())
+    return snapshot._replace(views=_views_for(snapshot, fingerprint))
+
+
+def _load_worker_snapshot(current: Optional[EngineSnapshot]) -> EngineSnapshot:
+    """
+    The snapshot the refresh worker last wrote. The app never opens the
+    source in worker mode; until the worker has written a snapshot (or while
+    it is replacing one) the load fails and is retried at the next poll.
+    """
+    manifest = snapshot_store.read_manifest()
+    fingerprint = manifest["fingerprint"] if manifest else None
+    if current is not None and fingerprint and fingerprint[:12] == current.version:
+        logging.info("Worker snapshot unchanged (%s), keeping it.", current.version)
+        return current._replace(loaded_at=time.time())
+
+    with metrics.stage("snapshot_load") as s:
+        cached = snapshot_store.load_snapshot(fingerprint) if fingerprint else None
+        s.frame(cached[0] if cached is not None else None)
+    if cached is None:
+        raise RuntimeError(
+            f"No readable snapshot from the refresh worker in {snapshot_store.SNAPSHOT_DIR}; "
+            "is refresh_scheduler.py running?"
         )
-        .sort_values("TotalRevenue", ascending=False)
+    df, artifacts = cached
+    return _make_snapshot(df, artifacts["model"], fingerprint)
+
+
+def _load_snapshot() -> EngineSnapshot:
+    """Load + clean + cluster the data and precompute everything served from it."""
+    current = _cache.peek()
+    if REFRESH_MODE == "worker":
+        return _load_worker_snapshot(current)
+
+    # Unchanged data keeps the current snapshot: a reload would build a second
+    # frame of the same version and throw away its profile, table index and
+    # samples. Scheduled refreshes run
+    # every interval, so this check uses the cheap change token; the checksum
+    # fingerprint is only computed once the token has moved.
+    token = _change_token()
+    if current is not None and token == current.token:
+        logging.info("Source unchanged (%s), keeping the current snapshot.", current.version)
+        return current._replace(loaded_at=time.time())
+
+    # the pipeline (scikit-learn, the SQL driver) is only imported by the first refresh
+    from data_pipeline import load_and_cluster_data
+
+    with metrics.stage("refresh") as s:
+        df, model, fingerprint = load_and_cluster_data()
+        s.frame(df)
+
+    # labelled with the fingerprint this frame was loaded under: the manifest
+    # may already belong to a newer snapshot written by another process
+    if current is not None and fingerprint and fingerprint[:12] == current.version:
+        logging.info("Data unchanged (%s), keeping the current snapshot.", current.version)
+        return current._replace(loaded_at=time.time(), token=token)
+    return _make_snapshot(df, model, fingerprint, token)
+
+
+# With a scheduler the data is refreshed in the background and requests only
+# read the current snapshot; the TTL only applies to lazy loading ("off").
+_scheduled = REFRESH_MODE in ("thread", "worker")
+_cache = EngineCache(_load_snapshot, ttl=float("inf") if _scheduled else CACHE_TTL)
+
+_scheduler = RefreshScheduler(
+    lambda: _cache.get(force=True),
+    probe=source_token if REFRESH_MODE == "thread" else snapshot_token,
+    # in worker mode the worker refreshes on its interval; the app follows its snapshots
+    interval=REFRESH_INTERVAL if REFRESH_MODE == "thread" else 0,
+    name="engine-refresh",
+)
+if _scheduled:
+    _scheduler.start()
+
+# no-op unless MARKETPULSE_METRICS_PORT is set
+metrics.start_http_server()
+
+
+@metrics.timed
+def refresh_data(force: bool = False) -> Tuple[pd.DataFrame, object]:
+    """
+    Return (df, model) from the engine cache.
+    The frame is a shallow copy of the cached one: no data is copied, and
+    with Copy-on-Write a caller's edits never reach the shared snapshot.
+    """
+    snapshot = _cache.get(force)
+    return snapshot.df.copy(deep=False), snapshot.model
+
+
+@metrics.timed
+def get_df() -> pd.DataFrame:
+    """Return latest dataframe with Cluster column."""
+    df, _ = refresh_data()
+    return df
+
+
+@metrics.timed
+def get_cube() -> SegmentCube:
+    """Return the segment aggregates for the latest dataframe."""
+    return _cache.get().cube
+
+
+@metrics.timed
+def get_eda_profile() -> eda_profile.DatasetProfile:
+    """Dataset statistics for the report page, built once per data version."""
+    return _profile(_cache.get())
+
+
+@metrics.timed
+def get_table_page(
+    page: int = 0,
+    page_size: int = 50,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+    filter_column: Optional[str] = None,
+    filter_value: str = "",
+    columns: Optional[List[str]] = None,
+) -> table_view.TablePage:
+    """One page of the customer table, filtered and sorted on the server."""
+    snapshot = _cache.get()
+    index = snapshot.memo.get("table_index", lambda: table_view.TableIndex(snapshot.df))
+    return index.page(
+        page, page_size, sort_by, descending, filter_column, filter_value, columns
     )
+
+
+@metrics.timed
+def get_view(role: str):
+    """
+    The precomputed view model for `role` (view_models.MANAGER, ...) of the
+    current data version. Shared by all sessions: treat as read-only.
+    """
+    return _cache.get().views[role]
+
+
+def invalidate_cache(hard: bool = False) -> None:
+    """
+    Mark cached data stale; `hard` forces the next read to reload synchronously.
+    With the scheduler running, a soft invalidation just asks it to refresh now.
+    """
+    if _scheduler.running and not hard:
+        _scheduler.trigger()
+        return
+    _cache.invalidate(hard)
+    if _scheduler.running:
+        _scheduler.trigger()
+
+
+def get_cache_info() -> Dict[str, object]:
+    info = _cache.info()
+    info["scheduler"] = _scheduler.info()
+    return info
+
+
+# ---------------------------------------------------------
+#   CLUSTER SUMMARY
+# ---------------------------------------------------------
+@metrics.timed
+def get_cluster_summary() -> pd.DataFrame:
+    """
+    Summary for clusters:
+    Cluster | Count | AvgIncome | AvgTotalSpend | AvgRecency
+    """
+    return _cluster_summary(get_cube())
+
+
+# ---------------------------------------------------------
+#   MANAGER DASHBOARD METRICS
+# ---------------------------------------------------------
+@metrics.timed
+def get_manager_kpis() -> Dict[str, float]:
+    return _manager_kpis(get_cube())
+
+
+@metrics.timed
+def get_revenue_by_segment() -> pd.DataFrame:
+    return _revenue_by_segment(get_cube())
+
+
+# ---------------------------------------------------------
+#   DATA ANALYST DASHBOARD METRICS
+# ---------------------------------------------------------
+@metrics.timed
+def get_segment_distribution() -> pd.DataFrame:
+    return _segment_distribution(get_cube())
+
+
+@metrics.timed
+def get_segment_spend_table() -> pd.DataFrame:
+    return _segment_spend_table(get_cube())
@@ -0,0 +1,467 @@
+"""
+benchmarks.py
+Reproducible performance harness for the refresh path, the engine getters and
+the dashboard renders, run against synthetic SQLite data (synthetic_data.py).
+
+    python benchmarks.py --scales 10k,100k,1M --out bench/baseline.json
+    python benchmarks.py --scales 10k,100k --compare bench/baseline.json
+    python benchmarks.py --imports --compare bench/baseline.json
+
+Each scale runs in its own process, so peak RSS and module-level caches are
+per scale. Every measurement records median/min wall time over `--repeat`
+runs, the peak traced allocation (tracemalloc, on a separate warm-up run)
+and the process peak RSS after the step. `--compare` exits non-zero when a
+step got slower or allocates more than `--tolerance` over the baseline.
+
+`--imports` times the cold import of the app's entry points with
+`python -X importtime` and fails when one of them loads a library it should
+only load on first use (plotting, scikit-learn, the SQL driver).
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+BENCH_DATA_DIR = os.getenv("MARKETPULSE_BENCH_DATA", "data/bench")
+
+# ignore timing differences below this (seconds); they are mostly noise
+MIN_DELTA_S = 0.005
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+def _rss_peak_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(
+    fn: Callable,
+    repeat: int = 3,
+    setup: Optional[Callable] = None,
+    trace: bool = True,
+):
+    """
+    Run `fn(*setup())` once under tracemalloc (warm-up + allocations), then
+    `repeat` timed runs. Setup is never timed. Returns (last result, stats).
+    """
+    def args():
+        return setup() if setup is not None else ()
+
+    stats: Dict[str, float] = {}
+    if trace:
+        a = args()
+        gc.collect()
+        tracemalloc.start()
+        result = fn(*a)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats["peak_alloc_mb"] = peak / 2**20
+        del a
+
+    times = []
+    for _ in range(max(repeat, 1)):
+        a = args()
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(*a)
+        times.append(time.perf_counter() - start)
+        del a
+
+    stats["wall_s"] = statistics.median(times)
+    stats["wall_min_s"] = min(times)
+    stats["rss_peak_mb"] = _rss_peak_mb()
+    return result, stats
+
+
+class Recorder:
+    """Collects named measurements for one scale."""
+
+    def __init__(self, repeat: int, trace: bool):
+        self.repeat = repeat
+        self.trace = trace
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def __call__(self, name: str, fn: Callable, setup: Optional[Callable] = None, repeat: Optional[int] = None):
+        result, stats = measure(fn, repeat or self.repeat, setup, self.trace)
+        self.results[name] = stats
+        self.log(name)
+        return result
+
+    def log(self, name: str) -> None:
+        stats = self.results[name]
+        logging.info(
+            "%-40s %9.2f ms  (alloc %.1f MB, rss %.0f MB)",
+            name, stats["wall_s"] * 1000, stats.get("peak_alloc_mb", float("nan")), stats["rss_peak_mb"],
+        )
+
+
+# -----------------------------
+# Suites
+# -----------------------------
+def dataset_path(n_rows: int, seed: int) -> str:
+    """Synthetic SQLite table for this scale, generated once and reused."""
+    import synthetic_data
+
+    path = os.path.join(BENCH_DATA_DIR, f"marketing_{n_rows}_s{seed}.db")
+    if not os.path.exists(path):
+        synthetic_data.write_dataset(path, n_rows, "sqlite", seed)
+    return path
+
+
+def bench_pipeline(record: Recorder, snapshot_dir: str) -> None:
+    """Each stage of load_and_cluster_data, then the whole call cold and warm."""
+    import data_pipeline
+    from data_sources import get_source
+    from segmentation import SegmentationModel
+
+    # the stages take their input as arguments, so each intermediate frame
+    # can be dropped before the next, larger one is built
+    with get_source().connection() as conn:
+        raw = record("pipeline.read", partial(data_pipeline.read_marketing_campaign, conn))
+
+    # cleaning and feature derivation share one pass in Preprocessor
+    df = record("pipeline.preprocess", partial(data_pipeline.make_preprocessor().fit_transform, raw))
+    del raw
+
+    model = SegmentationModel()
+
+    def encode(frame):
+        model._fit_schema(frame)
+        return model._raw_matrix(frame)
+
+    def raw_matrix(frame):
+        return (model._raw_matrix(frame),)
+
+    def scale(M):
+        model._fit_scaler([M])
+        return model._scale(M)
+
+    def fit(frame):
+        return SegmentationModel().fit(frame)
+
+    def copied(frame):
+        return (frame.copy(),)
+
+    record("pipeline.encode", partial(encode, df))
+    record("pipeline.scale", scale, setup=partial(raw_matrix, df))
+    # the shipped fit: schema, encoding, scaling, KMeans and cluster ordering
+    fitted = record("pipeline.segmentation_fit", partial(fit, df))
+    df["Cluster"] = fitted.labels_
+
+    record("pipeline.optimize_dtypes", data_pipeline.optimize_dtypes, setup=partial(copied, df))
+    del df
+
+    def clear_snapshots():
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return ()
+
+    record("pipeline.load_and_cluster.cold", data_pipeline.load_and_cluster_data, setup=clear_snapshots)
+    record("pipeline.load_and_cluster.snapshot", data_pipeline.load_and_cluster_data)
+
+
+ENGINE_GETTERS = [
+    "refresh_data",
+    "get_df",
+    "get_cube",
+    "get_cluster_summary",
+    "get_manager_kpis",
+    "get_revenue_by_segment",
+    "get_segment_distribution",
+    "get_segment_spend_table",
+]
+
+ENGINE_VIEWS = ["Manager", "Marketing Analyst", "Data Analyst"]
+
+
+def bench_engine(record: Recorder, repeat: int, snapshot_dir: str) -> None:
+    """Engine loads (cold, and from the snapshot as a new app process would), then each getter."""
+    import analytics_engine
+
+    def unloaded():
+        # before every call, the traced warm-up included, so none hits the engine cache
+        analytics_engine.invalidate_cache(hard=True)
+        return ()
+
+    def cold():
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return unloaded()
+
+    record("engine.load.cold", analytics_engine.refresh_data, setup=cold)
+    record("engine.load.snapshot", analytics_engine.refresh_data, setup=unloaded)
+
+    for name in ENGINE_GETTERS:
+        record(f"engine.{name}", getattr(analytics_engine, name), repeat=repeat)
+    for role in ENGINE_VIEWS:
+        record(f"engine.get_view.{role}", lambda role=role: analytics_engine.get_view(role), repeat=repeat)
+
+
+DASHBOARDS = [
+    ("manager_dashboard", "Manager"),
+    ("marketing_analyst_dashboard", "Marketing Analyst"),
+    ("data_analyst_home", "Data Analyst"),
+    ("data_analyst_insights", "Data Analyst"),
+    ("data_analyst_clusters", "Data Analyst"),
+    ("data_analyst_report", "Data Analyst"),
+    ("employee_dashboard", "Employee"),
+    ("admin_dashboard", "Admin"),
+]
+
+
+def bench_dashboards(record: Recorder) -> None:
+    """
+    Render each page function headlessly (Streamlit bare mode, default widget
+    values) with the engine loaded. `.cold` is the first render of a data
+    version (no cached figures, dataset profile or table index), `.warm` a
+    rerun.
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import streamlit as st
+        import analytics_engine
+        import dashboards
+        import figure_cache
+    except ImportError as e:
+        logging.warning("Skipping dashboard benchmarks: %s", e)
+        return
+
+    def new_version():
+        figure_cache.CACHE.clear()
+        analytics_engine._cache.get().memo.clear()
+        return ()
+
+    # bare mode warns on every st.* call, and Streamlit resets its own log
+    # levels, so logging is muted while rendering and the results logged after
+    previous = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        dashboards.init_da_state()
+        for name, role in DASHBOARDS:
+            st.session_state["role"] = role
+
+            def render(fn=getattr(dashboards, name)):
+                fn()
+                plt.close("all")
+
+            record(f"dashboard.{name}.cold", render, setup=new_version)
+            render()
+            record(f"dashboard.{name}.warm", render)
+    finally:
+        logging.disable(previous)
+
+    for name, _ in DASHBOARDS:
+        for kind in ("cold", "warm"):
+            if f"dashboard.{name}.{kind}" in record.results:
+                record.log(f"dashboard.{name}.{kind}")
+
+
+def run_scale(n_rows: int, repeat: int, getter_repeat: int, trace: bool, seed: int) -> Dict[str, Dict]:
+    # the engine is timed on demand, not refreshed by its background scheduler
+    os.environ["MARKETPULSE_REFRESH_MODE"] = "off"
+
+    import snapshot_store
+    from data_sources import SqliteSource, set_source
+
+    set_source(SqliteSource(dataset_path(n_rows, seed)))
+    snapshot_dir = tempfile.mkdtemp(prefix="marketpulse-bench-")
+    snapshot_store.SNAPSHOT_DIR = snapshot_dir
+
+    record = Recorder(repeat, trace)
+    try:
+        bench_pipeline(record, snapshot_dir)
+        bench_engine(record, getter_repeat, snapshot_dir)
+        bench_dashboards(record)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return record.results
+
+
+# -----------------------------
+# Import times
+# -----------------------------
+# entry point -> modules it must not import by itself (Streamlit itself
+# loads the light plotly.graph_objects shim; plotly.express is the heavy part)
+IMPORT_CHECKS = {
+    "App": ["pandas", "numpy", "matplotlib", "seaborn", "plotly.express", "sklearn", "pyodbc"],
+    "analytics_engine": ["matplotlib", "seaborn", "plotly.express", "sklearn", "pyodbc"],
+    "data_pipeline": ["matplotlib", "seaborn", "plotly.express", "sklearn", "pyodbc"],
+}
+
+
+def import_time(module: str):
+    """
+    Import `module` in a fresh interpreter under -X importtime.
+    Returns (cumulative seconds, names of all modules loaded).
+    """
+    env = dict(os.environ, MARKETPULSE_REFRESH_MODE="off")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True,
+    )
+    total, loaded = None, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        loaded.add(name.strip())
+        if name.strip() == module and not name[1:].startswith(" "):
+            total = int(cumulative) / 1e6
+    return total, loaded
+
+
+def bench_imports(repeat: int):
+    """Median/min import time per entry point, and any eager heavy imports."""
+    results: Dict[str, Dict[str, float]] = {}
+    violations: List[str] = []
+    for module, forbidden in IMPORT_CHECKS.items():
+        times = []
+        for _ in range(max(repeat, 1)):
+            seconds, loaded = import_time(module)
+            times.append(seconds)
+        results[f"import.{module}"] = {"wall_s": statistics.median(times), "wall_min_s": min(times)}
+        logging.info("%-40s %9.2f ms", f"import.{module}", results[f"import.{module}"]["wall_s"] * 1000)
+
+        eager = sorted(set(forbidden) & loaded)
+        if eager:
+            violations.append(f"import {module} loads {', '.join(eager)}")
+    return results, violations
+
+
+# -----------------------------
+# Baselines
+# -----------------------------
+def environment() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": time.time(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """Steps whose median wall time or peak allocation grew by more than `tolerance`."""
+    regressions = []
+    for scale, steps in current["results"].items():
+        base_steps = baseline.get("results", {}).get(scale, {})
+        for step, stats in steps.items():
+            base = base_steps.get(step)
+            if base is None:
+                continue
+
+            old, new = base["wall_s"], stats["wall_s"]
+            if new > old * (1 + tolerance) and new - old > MIN_DELTA_S:
+                regressions.append(f"{scale}/{step}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms")
+
+            old, new = base.get("peak_alloc_mb"), stats.get("peak_alloc_mb")
+            if old is not None and new is not None and new > old * (1 + tolerance) and new - old > 1.0:
+                regressions.append(f"{scale}/{step}: alloc {old:.1f} MB -> {new:.1f} MB")
+    return regressions
+
+
+def _run_in_subprocess(n_rows: int, args) -> Dict[str, Dict]:
+    fd, out = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--worker", str(n_rows), "--out", out,
+        "--repeat", str(args.repeat), "--getter-repeat", str(args.getter_repeat), "--seed", str(args.seed),
+    ]
+    if args.no_alloc:
+        cmd.append("--no-alloc")
+    try:
+        subprocess.run(cmd, check=True)
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        os.remove(out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import synthetic_data
+
+    parser = argparse.ArgumentParser(description="MarketPulse performance benchmarks.")
+    parser.add_argument("--scales", help="comma-separated row counts, e.g. 10k,1M (default 10k,100k)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per pipeline step / dashboard")
+    parser.add_argument("--getter-repeat", type=int, default=50, help="timed runs per engine getter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--out", help="write results as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--imports", action="store_true", help="report import times (skips scales unless given)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.worker is not None:
+        results = run_scale(args.worker, args.repeat, args.getter_repeat, not args.no_alloc, args.seed)
+        with open(args.out, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    scales = args.scales or ("" if args.imports else "10k,100k")
+
+    report = {"environment": environment(), "results": {}}
+    violations: List[str] = []
+    if args.imports:
+        logging.info("== imports ==")
+        report["results"]["imports"], violations = bench_imports(args.repeat)
+        for line in violations:
+            logging.warning("EAGER IMPORT %s", line)
+
+    for n_rows in (synthetic_data.parse_rows(s) for s in scales.split(",") if s):
+        logging.info("== %d rows ==", n_rows)
+        report["results"][str(n_rows)] = _run_in_subprocess(n_rows, args)
+
+    if args.out:
+        directory = os.path.dirname(args.out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info("Wrote %s", args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            logging.warning("REGRESSION %s", line)
+        if regressions:
+            return 1
+        logging.info("No regressions against %s.", args.compare)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Shared fixtures: `raw` is a synthetic MarketingCampaign table written to
+SQLite and read back through read_marketing_campaign(), so it has the
+pipeline's dtypes and NULL Income values.
+"""
+
+import pytest
+
+import synthetic_data
+from data_pipeline import read_marketing_campaign
+from data_sources import SqliteSource, get_source, set_source
+
+ROWS = 6000
+
+
+def _read_table(source):
+    """MarketingCampaign from `source`, read the way the pipeline reads it."""
+    previous = get_source()
+    set_source(source)
+    try:
+        with source.connection() as conn:
+            return read_marketing_campaign(conn)
+    finally:
+        set_source(previous)
+
+
+@pytest.fixture(scope="session")
+def read_table():
+    return _read_table
+
+
+@pytest.fixture(scope="module")
+def raw(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("data") / "marketing.db")
+    synthetic_data.write_sqlite(path, ROWS, seed=7)
+    return _read_table(SqliteSource(path))
@@ -1,24 +1,103 @@
+import importlib
+import logging
+import threading
+
 import streamlit as st
-import plotly.express as px
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
-
-
-# ---------- ANALYTICAL ENGINE ----------
-from analytics_engine import (
-    refresh_data,
-    get_manager_kpis,
-    get_revenue_by_segment,
-    get_segment_distribution,
-    get_segment_spend_table,
-    get_cluster_summary,
-)
-@st.cache_data(show_spinner=True)
-def load_data():
-    df, model = refresh_data()
-    return df
+
+import figure_cache
+import metrics
+
+# Plotting libraries, pandas and the analytics engine (which pulls in the
+# pipeline) are imported inside the pages that use them, so the login page
+# and the lighter pages do not wait for them. warm_up() loads the engine in
+# the background while the login page is shown.
+
+
+_warm_up_lock = threading.Lock()
+_warmed_up = False
+
+
+def _import_engine():
+    try:
+        importlib.import_module("analytics_engine")
+    except Exception:
+        logging.exception("Loading the analytics engine failed.")
+
+
+def warm_up():
+    """
+    Import the analytics engine in a daemon thread, once per process. The
+    import starts its background refresh, so the data is usually loaded by
+    the time the user has logged in.
+    """
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        _warmed_up = True
+    threading.Thread(target=_import_engine, name="engine-warm-up", daemon=True).start()
+
+
+def load_view(role: str):
+    """
+    The role's view model, precomputed by the engine for the current data
+    version and shared by all sessions; pages only render it.
+    """
+    from analytics_engine import get_view
+
+    with st.spinner("Loading data..."):
+        return get_view(role)
+
+
+def paged_table(key: str, columns, page_size: int = 50):
+    """
+    Table of the customer frame that is sorted, filtered and paged on the
+    server; only the visible page of rows is sent to the browser.
+    """
+    from analytics_engine import get_table_page
+
+    columns = list(columns)
+    none = "(none)"
+
+    c1, c2, c3, c4 = st.columns([2, 1, 2, 2])
+    sort_by = c1.selectbox("Sort by", [none] + columns, key=f"{key}_sort")
+    descending = c2.checkbox("Descending", key=f"{key}_desc")
+    filter_column = c3.selectbox("Filter column", [none] + columns, key=f"{key}_filter_col")
+    filter_value = c4.text_input(
+        "Filter value", key=f"{key}_filter",
+        help="Text to match, or for numbers: 5, >100, <=3 or 10..20",
+    )
+
+    page_key, query_key = f"{key}_page", f"{key}_query"
+    # a new sort or filter starts again from the first page
+    query = (sort_by, descending, filter_column, filter_value)
+    if st.session_state.get(query_key) != query:
+        st.session_state[query_key] = query
+        st.session_state[page_key] = 1
+
+    result = get_table_page(
+        st.session_state.get(page_key, 1) - 1,
+        page_size,
+        sort_by if sort_by != none else None,
+        descending,
+        filter_column if filter_column != none else None,
+        filter_value,
+        columns,
+    )
+
+    st.dataframe(result.rows, use_container_width=True)
+
+    # a narrower filter can leave the stored page past the end
+    if st.session_state.get(page_key, 1) > result.pages:
+        st.session_state[page_key] = result.pages
+    left, right = st.columns([1, 3])
+    left.number_input("Page", min_value=1, max_value=result.pages, step=1, key=page_key)
+    end = result.start + len(result.rows)
+    right.caption(
+        f"Rows {result.start + 1 if end else 0:,}–{end:,} of {result.total:,} "
+        f"· page {result.page + 1} of {result.pages}"
+    )
+
 
 # ---------- DATA ANALYST PAGE STATE ----------
 def init_da_state():
@@ -83,19 +162,21 @@ def show_dashboard():
 #  MANAGER DASHBOARD  
 # --------------------------------------------------------
 def manager_dashboard():
+    import pandas as pd
+    import plotly.express as px
+
     sidebar("Manager")
 
     # ---------------- Header ----------------
     st.title("Manager Dashboard")
 
     # ------ Load Real Data ------
-    df = load_data()
-    kpis = get_manager_kpis()
+    view = load_view("Manager")
 
-    total_customers = kpis["total_customers"]
-    avg_spend = round(kpis["avg_customer_spend"], 2)
-    total_revenue = round(kpis["total_revenue"], 2)
-    campaign_rate = round(kpis["accepted_campaign_rate"] * 100, 2)
+    total_customers = view.total_customers
+    avg_spend = round(view.avg_customer_spend, 2)
+    total_revenue = round(view.total_revenue, 2)
+    campaign_rate = round(view.accepted_campaign_rate * 100, 2)
 
     # ---------------- KPI Cards ----------------
     col1, col2, col3, col4 = st.columns(4)
@@ -136,21 +217,25 @@ def manager_dashboard():
 
     # ---------------- Revenue By Segment ----------------
     st.subheader("Revenue by Segment")
-    seg_df = get_revenue_by_segment()
+    seg_df = view.revenue_by_segment
 
     if seg_df.empty:
         st.info("No revenue data available.")
     else:
-        fig = px.bar(
-            seg_df,
-            x="Segment",
-            y="Revenue",
-            text="Revenue",
-            color="Segment",
-            height=380
-        )
-        fig.update_traces(textposition='outside')
-        fig.update_layout(showlegend=False)
+        def revenue_chart():
+            fig = px.bar(
+                seg_df,
+                x="Segment",
+                y="Revenue",
+                text="Revenue",
+                color="Segment",
+                height=380
+            )
+            fig.update_traces(textposition='outside')
+            fig.update_layout(showlegend=False)
+            return fig
+
+        fig = figure_cache.plotly_figure("revenue_by_segment", view.version, revenue_chart)
         st.plotly_chart(fig, use_container_width=True)
 
     # ---------- ROI SUMMARY TABLE ----------
@@ -172,6 +257,9 @@ def manager_dashboard():
 #  MARKETING ANALYST DASHBOARD
 # --------------------------------------------------------
 def marketing_analyst_dashboard():
+    import pandas as pd
+    import plotly.express as px
+
     sidebar("Marketing Analyst")
 
     # ---------- HEADER ----------
@@ -283,11 +371,15 @@ def marketing_analyst_dashboard():
         "ROI (%)": [312, 245, 178, 165, 198, 154]
     })
 
-    fig_line = px.line(
-        df_roi, x="Campaign", y="ROI (%)", markers=True
-    )
-    fig_line.update_traces(line_color="#1f77b4", marker_size=8)
-    fig_line.update_layout(height=360)
+    def roi_trend_chart():
+        fig_line = px.line(
+            df_roi, x="Campaign", y="ROI (%)", markers=True
+        )
+        fig_line.update_traces(line_color="#1f77b4", marker_size=8)
+        fig_line.update_layout(height=360)
+        return fig_line
+
+    fig_line = figure_cache.plotly_figure("roi_trend", figure_cache.STATIC, roi_trend_chart)
 
     st.plotly_chart(fig_line, use_container_width=True)
 
@@ -299,19 +391,24 @@ def marketing_analyst_dashboard():
     st.caption("How different segments responded to campaigns")
 
     # Load real segment distribution from analytics engine
-    seg_df = get_segment_distribution()  # Segment | CustomerCount
+    view = load_view("Marketing Analyst")
+    seg_df = view.segment_distribution  # Segment | CustomerCount
 
     if not seg_df.empty:
-        fig_bar = px.bar(
-            seg_df,
-            x="CustomerCount",
-            y="Segment",
-            orientation="h",
-            color="CustomerCount",
-            color_continuous_scale="Blues",
-            height=350
-        )
-        fig_bar.update_layout(showlegend=False)
+        def engagement_chart():
+            fig_bar = px.bar(
+                seg_df,
+                x="CustomerCount",
+                y="Segment",
+                orientation="h",
+                color="CustomerCount",
+                color_continuous_scale="Blues",
+                height=350
+            )
+            fig_bar.update_layout(showlegend=False)
+            return fig_bar
+
+        fig_bar = figure_cache.plotly_figure("segment_engagement", view.version, engagement_chart)
         st.plotly_chart(fig_bar, use_container_width=True)
     else:
         st.info("No segment data found. Please refresh engine.")
@@ -344,6 +441,8 @@ def marketing_analyst_dashboard():
 # =====================================================================
 
 def data_analyst_home():
+    import plotly.express as px
+
     sidebar("Data Analyst")
 
     st.title("Data Analyst Dashboard")
@@ -381,9 +480,9 @@ def data_analyst_home():
     """, unsafe_allow_html=True)
 
     # ---------- LOAD REAL DATA ----------
-    df = load_data()
-    seg_dist = get_segment_distribution()
-    spend_table = get_segment_spend_table()
+    view = load_view("Data Analyst")
+    seg_dist = view.segment_distribution
+    spend_table = view.spend_table
 
     # ---------- FEATURE CARDS ----------
     c1, c2, c3 = st.columns(3)
@@ -441,12 +540,12 @@ def data_analyst_home():
     # PIE CHART (REAL ENGINE DATA)
     with left:
         if not seg_dist.empty:
-            fig = px.pie(
+            fig = figure_cache.plotly_figure("segment_pie", view.version, lambda: px.pie(
                 seg_dist,
                 names="Segment",
                 values="CustomerCount",
                 hole=0.35
-            )
+            ))
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No segmentation data available from engine.")
@@ -455,8 +554,8 @@ def data_analyst_home():
     with right:
         if not seg_dist.empty:
             st.markdown("### Segment Overview")
-            for _, row in seg_dist.iterrows():
-                st.write(f"• **{row['Segment']}** → {row['CustomerCount']} customers")
+            for segment, count in zip(seg_dist["Segment"], seg_dist["CustomerCount"]):
+                st.write(f"• **{segment}** → {count} customers")
         else:
             st.write("No overview data available.")
 
@@ -485,8 +584,7 @@ def data_analyst_insights():
     st.title("📈 Insights")
     st.caption("Real segmentation & customer behavior insights from Azure SQL")
 
-    df = load_data()
-    summary = get_cluster_summary()
+    summary = load_view("Data Analyst").cluster_summary
 
     st.subheader("Cluster Summary")
     if not summary.empty:
@@ -510,21 +608,72 @@ def data_analyst_clusters():
     st.title("🧩 Cluster Insights")
     st.caption("Machine-learning based cluster breakdown")
 
-    df = load_data()
+    view = load_view("Data Analyst")
 
     # Cluster distribution chart
     st.subheader("Cluster Distribution")
-    if "Cluster" in df.columns:
-        st.bar_chart(df["Cluster"].value_counts().sort_index())
+    if not view.cluster_counts.empty:
+        st.bar_chart(view.cluster_counts)
     else:
         st.info("Cluster column missing from engine output.")
 
+    # a stratified sample keeps the chart the same size at any row count
+    if view.sample is not None:
+        st.subheader("Income vs Spend by Segment")
+        st.caption(f"Stratified sample of {len(view.sample):,} of {view.rows:,} customers")
+        st.scatter_chart(view.sample, x="Income", y="TotalSpend", color="Segment")
+
     st.subheader("Sample Customers")
-    st.dataframe(df.tail(20), use_container_width=True)
+    paged_table("cluster_customers", view.sample_columns or view.columns, page_size=20)
+
 
 
+def _distribution_figure(dist):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
+    fig, ax = plt.subplots(figsize=(8, 4))
+
+    if dist.numeric:
+        ax.bar(dist.edges[:-1], dist.counts, width=np.diff(dist.edges), align="edge",
+               color="#a855f7", alpha=0.75, edgecolor="white", linewidth=0.5)
+        ax.plot(dist.kde_x, dist.kde_y, color="#a855f7")
+        ax.set_xlabel(dist.column)
+        ax.set_ylabel("Count")
+    else:
+        pd.Series(dist.counts, index=dist.labels).plot(kind="bar", ax=ax, color="#a855f7")
+
+    ax.set_title(f"Distribution of {dist.column}")
+    return fig
+
+
+def _correlation_heatmap(corr):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import seaborn as sns
+
+    # MASK upper triangle for cleaner heatmap
+    mask = np.triu(np.ones_like(corr, dtype=bool))
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    sns.heatmap(
+        corr,
+        mask=mask,
+        annot=True,
+        cmap="Purples",
+        fmt=".2f",
+        linewidths=0.5,
+        square=True,
+        cbar=True,
+        ax=ax
+    )
+    return fig
+
 
 def data_analyst_report():
+    from analytics_engine import get_eda_profile
+
     sidebar("Data Analyst")
 
     if st.button("⬅ Back to Dashboard"):
@@ -534,7 +683,8 @@ def data_analyst_report():
     st.title("📥 Generate Report")
     st.caption("Explore dataset and generate insights")
 
-    df = load_data()
+    # summary, missing values, dtypes and correlations come precomputed with the view model
+    view = load_view("Data Analyst")
 
     # ================================
     # SIMPLE EDA SECTION
@@ -546,19 +696,7 @@ def data_analyst_report():
     # ------------------------------------------------
     st.markdown("### 📘 Dataset Summary")
 
-    summary_df = pd.DataFrame({
-        "Metric": ["Rows", "Columns", "Numeric Columns", "Categorical Columns", "Missing Values", "Duplicate Rows"],
-        "Value": [
-            df.shape[0],
-            df.shape[1],
-            len(df.select_dtypes(include=np.number).columns),
-            len(df.select_dtypes(exclude=np.number).columns),
-            df.isna().sum().sum(),
-            df.duplicated().sum()
-        ]
-    })
-
-    st.dataframe(summary_df, use_container_width=True)
+    st.dataframe(view.summary, use_container_width=True)
     st.markdown("---")
 
     # ------------------------------------------------
@@ -572,11 +710,12 @@ def data_analyst_report():
     )
 
     if option == "Head (Top 5)":
-        st.dataframe(df.head())
+        st.dataframe(view.head)
     elif option == "Tail (Bottom 5)":
-        st.dataframe(df.tail())
+        st.dataframe(view.tail)
     else:
-        st.dataframe(df)
+        # paged on the server; the whole frame never goes to the browser
+        paged_table("report_full", view.columns)
 
     st.markdown("---")
 
@@ -584,38 +723,30 @@ def data_analyst_report():
     # 3 — Missing Values
     # ------------------------------------------------
     st.markdown("### ⚠ Missing Value Summary")
-    missing_df = (
-        df.isna().sum().reset_index()
-        .rename(columns={"index": "Column", 0: "Missing Count"})
-    )
-    missing_df["Missing %"] = (missing_df["Missing Count"] / len(df) * 100).round(2)
-
-    st.dataframe(missing_df, use_container_width=True)
+    st.dataframe(view.missing, use_container_width=True)
     st.markdown("---")
 
     # ------------------------------------------------
     # 4 — Column Types
     # ------------------------------------------------
     st.markdown("### 🏷 Column Types")
-    st.write(df.dtypes)
+    st.write(view.dtypes)
     st.markdown("---")
 
     # ------------------------------------------------
     # 5 — Distribution Explorer
     # ------------------------------------------------
     st.markdown("### 📊 Column Distribution Explorer")
-    col_to_plot = st.selectbox("Select a column", df.columns)
+    col_to_plot = st.selectbox("Select a column", view.columns)
 
     if col_to_plot:
-        fig, ax = plt.subplots(figsize=(8, 4))
-
-        if np.issubdtype(df[col_to_plot].dtype, np.number):
-            sns.histplot(df[col_to_plot].dropna(), kde=True, ax=ax, color="#a855f7")
-        else:
-            df[col_to_plot].value_counts().plot(kind="bar", ax=ax, color="#a855f7")
-
-        ax.set_title(f"Distribution of {col_to_plot}")
-        st.pyplot(fig)
+        # computed and rendered the first time a column is picked, then reused
+        st.image(
+            figure_cache.png("distribution", view.version,
+                             lambda: _distribution_figure(get_eda_profile().distribution(col_to_plot)),
+                             {"column": col_to_plot}),
+            use_container_width=True,
+        )
 
     st.markdown("---")
 
@@ -624,27 +755,11 @@ def data_analyst_report():
     # ------------------------------------------------
     st.markdown("### 🔥 Correlation Heatmap")
 
-    numeric_df = df.select_dtypes(include=np.number)
-
-    if numeric_df.shape[1] > 1:
-        corr = numeric_df.corr()
-
-        # MASK upper triangle for cleaner heatmap
-        mask = np.triu(np.ones_like(corr, dtype=bool))
-
-        fig, ax = plt.subplots(figsize=(10, 8))
-        sns.heatmap(
-            corr,
-            mask=mask,
-            annot=True,
-            cmap="Purples",
-            fmt=".2f",
-            linewidths=0.5,
-            square=True,
-            cbar=True,
-            ax=ax
-        )
-        st.pyplot(fig)
+    if view.corr is not None:
+        # the annotated heatmap is rendered once per data version
+        st.image(figure_cache.png("correlation_heatmap", view.version,
+                                  lambda: _correlation_heatmap(view.corr)),
+                 use_container_width=True)
     else:
         st.info("Not enough numeric columns for correlation heatmap.")
 
@@ -658,6 +773,8 @@ def data_analyst_report():
 #  EMPLOYEE DASHBOARD
 # --------------------------------------------------------
 def employee_dashboard():
+    import pandas as pd
+
     sidebar("Employee")
 
     st.title("Employee Dashboard")
@@ -808,6 +925,11 @@ def employee_dashboard():
 #  ADMIN DASHBOARD
 # --------------------------------------------------------
 def admin_dashboard():
+    import pandas as pd
+    import plotly.express as px
+
+    from analytics_engine import get_cache_info, invalidate_cache
+
     sidebar("Admin")
     st.title("Admin Dashboard")
 
@@ -899,21 +1021,31 @@ def admin_dashboard():
         </div>
         """, unsafe_allow_html=True)
 
+    uptime = metrics.uptime_seconds()
+    days, rest = divmod(int(uptime), 86400)
+    uptime_text = f"{days}d {rest // 3600}h" if days else f"{rest // 3600}h {rest % 3600 // 60}m"
+
     with c2:
-        st.markdown("""
+        st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">System Uptime</div>
-            <div class="metric-value">99.8%</div>
-            <div class="metric-sub">Last 30 days</div>
+            <div class="metric-value">{uptime_text}</div>
+            <div class="metric-sub">Since last restart</div>
         </div>
         """, unsafe_allow_html=True)
 
+    sizes = metrics.REGISTRY.gauges("database_size_bytes")
+    source_name, size = next(iter(sizes.items()), ("not measured yet", None))
+    size_text = "—" if size is None else (
+        f"{size / 2**30:.1f} GB" if size >= 2**30 else f"{size / 2**20:.1f} MB"
+    )
+
     with c3:
-        st.markdown("""
+        st.markdown(f"""
         <div class="metric-card">
             <div class="metric-title">Database Size</div>
-            <div class="metric-value">24.5 GB</div>
-            <div class="metric-sub">of 100 GB</div>
+            <div class="metric-value">{size_text}</div>
+            <div class="metric-sub">{source_name}</div>
         </div>
         """, unsafe_allow_html=True)
 
@@ -978,6 +1110,60 @@ def admin_dashboard():
             st.toggle("", key="api_access")
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # Analytics data cache
+    info = get_cache_info()
+    age = f"{info['age_seconds'] / 60:.0f} min old" if info["age_seconds"] is not None else "not loaded"
+    st.caption(f"Analytics data version: {info['version'] or '—'} ({age})")
+    scheduler = info["scheduler"]
+    if scheduler["running"]:
+        next_at = scheduler["next_refresh"]
+        next_text = pd.Timestamp(next_at, unit="s").strftime("%H:%M:%S") if next_at else "on source change"
+        st.caption(f"Background refresh: {scheduler['refreshes']} runs, next {next_text}")
+        if scheduler["last_error"]:
+            st.warning(f"Last background refresh failed: {scheduler['last_error']}")
+    if st.button("🔄 Refresh Analytics Data"):
+        invalidate_cache()
+        st.success("Analytics data will refresh in the background.")
+
+    # --------------------------------------------------------
+    # PIPELINE PERFORMANCE
+    # --------------------------------------------------------
+    st.subheader("Pipeline Performance")
+    st.caption("Recent refresh stages and engine getter timings in this process")
+    memory = metrics.memory_by_type()
+    if memory:
+        st.caption(
+            f"Process memory: {memory.get('anon', 0) / 2**20:.0f} MB private, "
+            f"{memory.get('file', 0) / 2**20:.0f} MB file-backed (shared with other processes)"
+        )
+
+    stages = metrics.REGISTRY.stages()[:20]
+    if stages:
+        stage_df = pd.DataFrame(stages)
+        stage_df["at"] = pd.to_datetime(stage_df["at"], unit="s").dt.strftime("%H:%M:%S")
+        stage_df["ms"] = (stage_df.pop("seconds") * 1000).round(1)
+        stage_df["rss_delta_mb"] = stage_df["rss_delta_mb"].round(1)
+        st.dataframe(stage_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No refresh has run in this process yet.")
+
+    getters = metrics.REGISTRY.summaries("getter_duration_seconds")
+    if getters:
+        st.dataframe(
+            pd.DataFrame(
+                [(name, calls, total / calls * 1000) for name, (calls, total) in getters.items()],
+                columns=["Getter", "Calls", "Avg ms"],
+            ).sort_values("Avg ms", ascending=False).round({"Avg ms": 2}),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+    figures = figure_cache.CACHE.info()
+    st.caption(
+        f"Figure cache: {figures['entries']} charts, {figures['bytes'] / 2**20:.1f} of "
+        f"{figures['budget_bytes'] / 2**20:.0f} MB, {figures['hits']} hits / {figures['misses']} misses"
+    )
+
     # Manual Backup Button
     if st.button("💾 Run Manual Backup"):
         with st.spinner("Running backup..."):
@@ -995,7 +1181,9 @@ def admin_dashboard():
         "Time": ["00:00", "04:00", "08:00", "12:00", "16:00", "20:00", "24:00"],
         "Uptime": [99.9, 99.76, 99.85, 100, 99.6, 99.82, 100]
     })
-    fig = px.line(df_up, x="Time", y="Uptime", markers=True)
+    fig = figure_cache.plotly_figure(
+        "uptime", figure_cache.STATIC, lambda: px.line(df_up, x="Time", y="Uptime", markers=True)
+    )
     st.plotly_chart(fig, use_container_width=True)
 
     # --------------------------------------------------------
@@ -1,105 +1,437 @@
+import hashlib
 import logging
 import os
-import pyodbc
+from typing import Dict, List, Optional, Tuple
+
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from dotenv import load_dotenv
-
-# load .env file
-load_dotenv()
-
-SERVER = "bidemoserver.database.windows.net"
-DATABASE = "MarketingAnalyticsDB"
-USERNAME = "bi-sql-admin"
-PASSWORD = os.getenv("SQL_PASSWORD")
-
-def get_connection():
-    conn_str = (
-        "DRIVER={ODBC Driver 18 for SQL Server};"
-        f"SERVER={SERVER};"
-        f"DATABASE={DATABASE};"
-        f"UID={USERNAME};"
-        f"PWD={PASSWORD};"
-        "Encrypt=yes;"
-        "TrustServerCertificate=no;"
-        "Connection Timeout=30;"
+
+import metrics
+import snapshot_store
+import segmentation
+from data_sources import get_source
+from preprocessing import Preprocessor
+from segmentation import SegmentationModel
+
+# Bump when the cleaning / clustering logic changes, so old snapshots are not reused.
+PIPELINE_VERSION = "5"
+
+# Incremental refresh: only pull rows past the last high-water mark.
+# A rowversion column sees inserts and updates, so it is on by default when
+# one is configured. Without one, the ID column only sees new customers, so
+# MARKETPULSE_INCREMENTAL=1 is only safe for append-only tables (a change
+# with no new IDs still triggers a full reload).
+ROWVERSION_COLUMN = os.getenv("MARKETPULSE_ROWVERSION_COLUMN")
+INCREMENTAL_REFRESH = os.getenv("MARKETPULSE_INCREMENTAL", "1" if ROWVERSION_COLUMN else "0") == "1"
+
+# Columns the pipeline and dashboards use, with the dtype each is read into.
+# Integer columns that turn out to contain NULLs fall back to float32.
+CAMPAIGN_SCHEMA = {
+    "ID": "int32",
+    "Year_Birth": "int16",
+    "Education": "category",
+    "Marital_Status": "category",
+    "Income": "float32",
+    "Kidhome": "int8",
+    "Teenhome": "int8",
+    "Dt_Customer": "datetime64[ns]",
+    "Recency": "int16",
+    "MntWines": "float32",
+    "MntFruits": "float32",
+    "MntMeatProducts": "float32",
+    "MntFishProducts": "float32",
+    "MntSweetProducts": "float32",
+    "MntGoldProds": "float32",
+    "NumDealsPurchases": "int16",
+    "NumWebPurchases": "int16",
+    "NumCatalogPurchases": "int16",
+    "NumStorePurchases": "int16",
+    "NumWebVisitsMonth": "int16",
+    "AcceptedCmp3": "int8",
+    "AcceptedCmp4": "int8",
+    "AcceptedCmp5": "int8",
+    "AcceptedCmp1": "int8",
+    "AcceptedCmp2": "int8",
+    "Complain": "int8",
+    "Response": "int8",
+}
+
+CHUNK_SIZE = int(os.getenv("MARKETPULSE_CHUNK_SIZE", "50000"))
+
+def get_source_stats(conn) -> Tuple[int, object]:
+    """Row count + change token of MarketingCampaign, from the configured source."""
+    return get_source().stats(conn)
+
+
+def get_source_fingerprint(conn, stats: Optional[Tuple[int, object]] = None) -> str:
+    """
+    Cheap fingerprint of MarketingCampaign: row count + the source's change token.
+    Today's date is part of the key because Age and Customer_Tenure depend on it.
+    """
+    count, checksum = stats if stats is not None else get_source_stats(conn)
+    key = f"{PIPELINE_VERSION}|{count}|{checksum}|{_today()}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _today() -> str:
+    return str(pd.Timestamp("today").date())
+
+
+def _high_water_mark(raw: pd.DataFrame) -> Dict[str, object]:
+    """High-water marks of a raw SQL frame, in a JSON-friendly form."""
+    hwm = {}
+    if "ID" in raw.columns and len(raw):
+        hwm["id"] = int(raw["ID"].max())
+    if ROWVERSION_COLUMN and ROWVERSION_COLUMN in raw.columns and len(raw):
+        hwm["rowversion"] = bytes(raw[ROWVERSION_COLUMN].max()).hex()
+    return hwm
+
+
+# -----------------------------
+# Streaming SQL reader
+# -----------------------------
+def _convert_chunk(values, dtype: str, categories: Dict[object, int]) -> np.ndarray:
+    """Turn one column of a fetched batch into a typed NumPy array."""
+    n = len(values)
+
+    if dtype == "category":
+        # codes into a lookup that grows across batches; -1 marks NULL
+        return np.fromiter(
+            (-1 if v is None else categories.setdefault(v, len(categories)) for v in values),
+            dtype=np.int32,
+            count=n,
+        )
+
+    if dtype.startswith("datetime"):
+        return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype)
+
+    if dtype == "object":
+        return np.array(values, dtype=object)
+
+    arr = np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=n)
+    if dtype.startswith("int") and not np.isnan(arr).any():
+        # astype() would silently wrap values outside the declared range
+        info = np.iinfo(dtype)
+        if n and (arr.min() < info.min or arr.max() > info.max):
+            logging.warning("Values outside the %s range, reading the column as int64.", dtype)
+            return arr.astype(np.int64)
+        return arr.astype(dtype)
+    return arr.astype(np.float32)
+
+
+def read_marketing_campaign(
+    conn,
+    where: str = "",
+    params: Optional[List[object]] = None,
+    chunksize: int = CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Stream MarketingCampaign with `fetchmany`, selecting only CAMPAIGN_SCHEMA
+    columns and converting each batch straight into its declared dtype, so the
+    full table never exists as Python objects at once.
+    """
+    schema = dict(CAMPAIGN_SCHEMA)
+    if ROWVERSION_COLUMN:
+        schema[ROWVERSION_COLUMN] = "object"
+
+    select = ", ".join(get_source().quote(c) for c in schema)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {select} FROM MarketingCampaign {where}", params or [])
+
+    chunks: Dict[str, List[np.ndarray]] = {c: [] for c in schema}
+    lookups: Dict[str, Dict[object, int]] = {c: {} for c, t in schema.items() if t == "category"}
+
+    while True:
+        rows = cursor.fetchmany(chunksize)
+        if not rows:
+            break
+        for col, values in zip(schema, zip(*rows)):
+            chunks[col].append(_convert_chunk(values, schema[col], lookups.get(col)))
+        del rows
+    cursor.close()
+
+    data = {}
+    for col, dtype in schema.items():
+        parts = chunks.pop(col)
+        if not parts:
+            arr = np.empty(0, dtype=np.int32 if dtype == "category" else dtype)
+        else:
+            arr = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        del parts
+
+        if dtype == "category":
+            categories = list(lookups[col])
+            data[col] = pd.Categorical.from_codes(arr, categories=categories).reorder_categories(
+                sorted(categories)
+            )
+        else:
+            data[col] = arr
+
+    return pd.DataFrame(data, copy=False)
+
+
+def make_preprocessor() -> Preprocessor:
+    return Preprocessor(extra_drop_columns=[ROWVERSION_COLUMN] if ROWVERSION_COLUMN else None)
+
+
+def load_and_cluster_data(use_snapshot: bool = True, incremental: Optional[bool] = None):
+    """
+    Return (df, model, fingerprint): the clustered frame, its segmentation
+    model and the source fingerprint the frame was loaded or snapshotted
+    under (None with use_snapshot=False).
+    """
+    if incremental is None:
+        incremental = INCREMENTAL_REFRESH
+
+    source = get_source()
+    logging.info(f"Connecting to {source.name}...")
+
+    def probe(conn):
+        size = source.size_bytes(conn)
+        if not use_snapshot:
+            return size, None, None
+        stats = get_source_stats(conn)
+        return size, stats, get_source_fingerprint(conn, stats)
+
+    size, stats, fingerprint = source.run(probe)
+    if size is not None:
+        metrics.REGISTRY.set_gauge(
+            "database_size_bytes", size, "Storage used by the source database.", source=source.name
+        )
+
+    if not use_snapshot:
+        return (*_load_full(source), None)
+
+    cached = _load_cached(fingerprint)
+    if cached is not None:
+        return (*cached, fingerprint)
+
+    # one process refreshes at a time; the others wait here and then
+    # usually find the snapshot it just wrote
+    with snapshot_store.writer_lock():
+        cached = _load_cached(fingerprint)
+        if cached is not None:
+            return (*cached, fingerprint)
+
+        if incremental:
+            merged = source.run(lambda conn: _load_incremental(conn, stats[0], fingerprint))
+            if merged is not None:
+                return (*merged, fingerprint)
+
+        return (*_load_full(source, fingerprint), fingerprint)
+
+
+def _load_cached(fingerprint: str):
+    """(df, model) from the snapshot for `fingerprint`, or None."""
+    with metrics.stage("snapshot_load") as s:
+        cached = snapshot_store.load_snapshot(fingerprint)
+        s.frame(cached[0] if cached is not None else None)
+    if cached is None:
+        return None
+    df, artifacts = cached
+    return df, artifacts["model"]
+
+
+def _load_full(source, fingerprint: Optional[str] = None):
+    """Read, clean and cluster the whole table; snapshot it under `fingerprint`."""
+    # -----------------------------
+    # 1. Load data from SQL
+    # -----------------------------
+    with metrics.stage("sql_fetch") as s:
+        raw = source.run(read_marketing_campaign)
+        s.frame(raw)
+
+    hwm = _high_water_mark(raw)
+    source_rows = len(raw)
+
+    preprocessor = make_preprocessor()
+    df = preprocessor.fit_transform(raw)
+    del raw
+    df, model = segment_frame(df)
+    with metrics.stage("dtype_optimisation") as s:
+        df, _ = optimize_dtypes(df)
+        s.frame(df)
+
+    if fingerprint is not None:
+        artifacts = {"model": model, "preprocessor": preprocessor}
+        meta = {"hwm": hwm, "source_rows": source_rows, "date": _today(),
+                "pipeline_version": PIPELINE_VERSION}
+        with metrics.stage("snapshot_save"):
+            if snapshot_store.save_snapshot(df, artifacts, fingerprint, meta):
+                df = _attach_shared(df, fingerprint)
+
+    return df, model
+
+
+def _attach_shared(df: pd.DataFrame, fingerprint: str) -> pd.DataFrame:
+    """
+    In shared-snapshot mode, swap the frame just built for read-only views of
+    the file just written, so the process holding the refresh does not keep a
+    private copy next to the mapped one.
+    """
+    if not snapshot_store.SHARED_SNAPSHOT:
+        return df
+    cached = snapshot_store.load_snapshot(fingerprint)
+    return cached[0] if cached is not None else df
+
+
+def segment_frame(df: pd.DataFrame, force_refit: bool = False):
+    """
+    Assign clusters with the persisted segmentation model.
+    The model is only refitted when there is none yet, the pipeline or backend
+    changed, the refit interval has passed, or the data has drifted from the
+    centroids.
+    """
+    model = None if force_refit else snapshot_store.load_model()
+    reusable = (
+        model is not None
+        and getattr(model, "pipeline_version", None) == PIPELINE_VERSION
+        and getattr(model, "backend", "kmeans") == segmentation.BACKEND
+        and not model.is_due()
     )
-    return pyodbc.connect(conn_str)
+    if reusable:
+        labels, drift = model.assign(df)
+        if not model.has_drifted(drift):
+            df["Cluster"] = labels
+            return df, model
+        logging.info("Segment drift %.2f over threshold, refitting.", drift)
+
+    model = SegmentationModel()
+    df["Cluster"] = model.fit_predict(df)
+    model.pipeline_version = PIPELINE_VERSION
+    snapshot_store.save_model(model)
+    logging.info("Fitted segmentation model on %d rows.", len(df))
+
+    return df, model
 
 
-def load_and_cluster_data():
-    logging.info("Connecting to Azure SQL...")
-    conn = get_connection()
+def _load_incremental(conn, source_rows: int, fingerprint: str):
+    """
+    Merge rows past the previous snapshot's high-water mark into it.
+    Returns None when a full reload is needed instead (no usable snapshot,
+    a new day, or changes the watermark cannot see: deletions, and with the
+    ID watermark, updates to existing rows).
+    """
+    manifest = snapshot_store.read_manifest()
+    if (
+        manifest is None
+        or manifest.get("date") != _today()
+        or manifest.get("pipeline_version") != PIPELINE_VERSION
+    ):
+        return None
 
-    try:
-        # -----------------------------
-        # 1. Load data from SQL
-        # -----------------------------
-        df = pd.read_sql("SELECT * FROM MarketingCampaign", conn)
+    hwm = manifest.get("hwm", {})
+    by_rowversion = bool(ROWVERSION_COLUMN) and "rowversion" in hwm
+    if by_rowversion:
+        where = f"WHERE {get_source().quote(ROWVERSION_COLUMN)} > ?"
+        param = bytes.fromhex(hwm["rowversion"])
+    elif "id" in hwm:
+        where = "WHERE ID > ?"
+        param = hwm["id"]
+    else:
+        return None
 
-        # Missing Income
-        df["Income"] = df["Income"].fillna(df["Income"].median())
+    cached = snapshot_store.load_snapshot(manifest["fingerprint"])
+    if cached is None:
+        return None
+    df, artifacts = cached
 
-        # Drop junk columns
-        df = df.drop(columns=[c for c in ["ID", "Z_CostContact", "Z_Revenue"] if c in df.columns], errors="ignore")
+    with metrics.stage("sql_fetch_delta") as s:
+        delta = read_marketing_campaign(conn, where, [param])
+        s.frame(delta)
 
-        # Compute age
-        df["Age"] = pd.Timestamp("today").year - df["Year_Birth"]
-        df = df[(df["Age"] >= 18) & (df["Age"] <= 100)]
+    # rows we have never seen before (changed rows keep their old ID)
+    new_rows = int((delta["ID"] > hwm.get("id", -1)).sum()) if "ID" in delta.columns else len(delta)
+    if manifest.get("source_rows", -1) + new_rows != source_rows:
+        logging.info("Row count drifted from the snapshot, doing a full reload.")
+        return None
+    # the fingerprint changed, but the ID watermark found no new rows: existing
+    # rows were updated, which only a full reload picks up
+    if not by_rowversion and not len(delta):
+        logging.info("Source changed without new rows, doing a full reload.")
+        return None
 
-        # Parse customer date
-        if "Dt_Customer" in df.columns:
-            df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], errors="coerce")
-            df["Dt_Customer"] = df["Dt_Customer"].fillna(df["Dt_Customer"].mode()[0])
-            df["Customer_Tenure"] = (pd.Timestamp("today") - df["Dt_Customer"]).dt.days
+    logging.info("Incremental refresh: %d changed rows.", len(delta))
 
-        # Fill nulls
-        num_cols = df.select_dtypes(include="number").columns
-        cat_cols = df.select_dtypes(include="object").columns
+    if len(delta):
+        delta_df = artifacts["preprocessor"].transform(delta)
+        delta_df["Cluster"] = artifacts["model"].predict(delta_df)
+        df = pd.concat([df.drop(index=delta["ID"], errors="ignore"), delta_df])
+        for col in df.columns:
+            if CAMPAIGN_SCHEMA.get(col) == "category" and df[col].dtype != "category":
+                df[col] = df[col].astype("category")
 
-        for col in num_cols:
-            df[col] = df[col].fillna(df[col].median())
-        for col in cat_cols:
-            df[col] = df[col].fillna(df[col].mode()[0])
+        df, _ = optimize_dtypes(df)
 
-        # Feature engineering
-        df["TotalSpend"] = df[[c for c in df.columns if c.startswith("Mnt")]].sum(axis=1)
-        df["TotalPurchases"] = df[[c for c in df.columns if c.endswith("Purchases")]].sum(axis=1)
+        new_hwm = _high_water_mark(delta)
+        hwm = {k: max(hwm.get(k, v), v) for k, v in new_hwm.items()}
 
-        if set(["Kidhome", "Teenhome"]).issubset(df.columns):
-            df["FamilySize"] = df["Kidhome"] + df["Teenhome"]
-            df["IsParent"] = (df["FamilySize"] > 0).astype(int)
+    meta = {"hwm": hwm, "source_rows": source_rows, "date": _today(),
+            "pipeline_version": PIPELINE_VERSION}
+    with metrics.stage("snapshot_save"):
+        if snapshot_store.save_snapshot(df, artifacts, fingerprint, meta):
+            df = _attach_shared(df, fingerprint)
 
-        # accepted campaign columns
-        camp_cols = [c for c in df.columns if c.lower().startswith("acceptedcmp")]
-        if "Response" in df.columns:
-            camp_cols.append("Response")
-        df["AcceptedAnyCampaign"] = (df[camp_cols].sum(axis=1) > 0).astype(int)
+    return df, artifacts["model"]
 
-        # outlier handling
-        for col in ["Income", "TotalSpend"]:
-            low, high = df[col].quantile([0.01, 0.99])
-            df[col] = df[col].clip(lower=low, upper=high)
 
-        df = df.drop(columns=["Dt_Customer"], errors="ignore")
+# -----------------------------
+# Memory-compact dtypes
+# -----------------------------
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
 
-        # encode + scale
-        encoded = pd.get_dummies(df, drop_first=True)
-        encoded = encoded.replace([np.inf, -np.inf], np.nan).fillna(encoded.median())
 
-        scaler = StandardScaler()
-        scaled = encoded.copy()
-        scaled[encoded.columns] = scaler.fit_transform(encoded)
+def _compact_dtype(s: pd.Series):
+    """Smallest dtype that holds `s` without changing its values, or None."""
+    dtype = s.dtype
 
-        # KMeans
-        kmeans = KMeans(n_clusters=4, random_state=42, n_init="auto")
-        scaled["Cluster"] = kmeans.fit_predict(scaled)
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return None
 
-        df["Cluster"] = scaled["Cluster"]
+    if pd.api.types.is_integer_dtype(dtype):
+        if not len(s):
+            return None
+        low, high = s.min(), s.max()
+        # 0/1 flags stay numeric (int8), so dashboards still count them as numbers
+        for t in INT_TYPES:
+            info = np.iinfo(t)
+            if info.min <= low and high <= info.max:
+                return t if np.dtype(t) != dtype else None
 
-        return df, kmeans
+    if pd.api.types.is_float_dtype(dtype) and dtype == np.float64:
+        values = s.to_numpy()
+        as32 = values.astype(np.float32)
+        with np.errstate(invalid="ignore"):
+            if np.allclose(as32, values, rtol=1e-6, atol=0, equal_nan=True):
+                return np.float32
 
-    finally:
-        conn.close()
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        if len(s) and s.nunique(dropna=True) <= len(s) // 2:
+            return "category"
+
+    return None
+
+
+def optimize_dtypes(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, object]]:
+    """
+    Downcast columns to the smallest lossless dtype: int8/int16/int32 for
+    integers and 0/1 flags, float32 where it round-trips, category for
+    low-cardinality strings. Returns (df, report) and logs memory before/after.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+
+    changed = {}
+    for col in df.columns:
+        target = _compact_dtype(df[col])
+        if target is not None:
+            changed[col] = (str(df[col].dtype), str(np.dtype(target)) if target != "category" else "category")
+            df[col] = df[col].astype(target)
+
+    after = int(df.memory_usage(deep=True).sum())
+    report = {"before_bytes": before, "after_bytes": after, "columns": changed}
+
+    logging.info(
+        "Dtype optimisation: %.1f MB -> %.1f MB (%d columns downcast).",
+        before / 2**20, after / 2**20, len(changed),
+    )
+    return df, report
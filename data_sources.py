@@ -0,0 +1,401 @@
+"""
+data_sources.py
+Pluggable sources for the MarketingCampaign table.
+`azure` (default) is the production Azure SQL database behind a pooled,
+retrying ODBC connection; `sqlite` and `duckdb` read a local file so the
+pipeline and dashboards can run and be profiled offline (see synthetic_data.py).
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# load .env file
+load_dotenv()
+
+SERVER = "bidemoserver.database.windows.net"
+DATABASE = "MarketingAnalyticsDB"
+USERNAME = "bi-sql-admin"
+PASSWORD = os.getenv("SQL_PASSWORD")
+
+# azure | sqlite | duckdb  (duckdb also reads .parquet files)
+DATA_SOURCE = os.getenv("MARKETPULSE_DATA_SOURCE", "azure")
+LOCAL_DB_PATH = os.getenv("MARKETPULSE_LOCAL_DB", "data/marketing.db")
+
+TABLE = "MarketingCampaign"
+
+# Connection pool / retry policy
+POOL_SIZE = int(os.getenv("MARKETPULSE_POOL_SIZE", "4"))
+POOL_TIMEOUT = float(os.getenv("MARKETPULSE_POOL_TIMEOUT", "30"))
+HEALTH_CHECK_AFTER = float(os.getenv("MARKETPULSE_HEALTH_CHECK_AFTER", "30"))
+CONNECT_RETRIES = int(os.getenv("MARKETPULSE_CONNECT_RETRIES", "4"))
+RETRY_BACKOFF = float(os.getenv("MARKETPULSE_RETRY_BACKOFF", "0.5"))
+
+# ODBC SQLSTATEs and Azure SQL error numbers that are worth retrying
+TRANSIENT_ERRORS = (
+    "08S01", "08001", "HYT00", "HYT01",
+    "4060", "40197", "40501", "40613", "49918", "49919", "49920", "10928", "10929",
+)
+
+def db_errors() -> Tuple[type, ...]:
+    """
+    pyodbc's error class once pyodbc is loaded. pyodbc is only imported by
+    the Azure source; before that no pyodbc error can be raised.
+    """
+    pyodbc = sys.modules.get("pyodbc")
+    return (pyodbc.Error,) if pyodbc is not None else ()
+
+
+def _is_transient(error: Exception) -> bool:
+    text = " ".join(str(a) for a in getattr(error, "args", ()))
+    return any(code in text for code in TRANSIENT_ERRORS)
+
+
+def with_retry(fn: Callable, retries: Optional[int] = None, backoff: Optional[float] = None):
+    """
+    Call `fn()` and retry transient pyodbc errors with exponential backoff
+    (backoff, 2*backoff, 4*backoff, ...). Other errors are raised immediately.
+    """
+    retries = CONNECT_RETRIES if retries is None else retries
+    backoff = RETRY_BACKOFF if backoff is None else backoff
+
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except db_errors() as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+            delay = backoff * (2 ** attempt)
+            logging.warning("Transient SQL error (%s), retrying in %.1fs...", e, delay)
+            time.sleep(delay)
+
+
+def get_connection():
+    conn_str = (
+        "DRIVER={ODBC Driver 18 for SQL Server};"
+        f"SERVER={SERVER};"
+        f"DATABASE={DATABASE};"
+        f"UID={USERNAME};"
+        f"PWD={PASSWORD};"
+        "Encrypt=yes;"
+        "TrustServerCertificate=no;"
+        "Connection Timeout=30;"
+    )
+    try:
+        import pyodbc
+    except ImportError as e:
+        raise ImportError("pyodbc is required for the Azure SQL data source.") from e
+    # read-only workload, so autocommit keeps pooled connections out of open transactions
+    return with_retry(lambda: pyodbc.connect(conn_str, autocommit=True))
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of ODBC connections.
+    Connections idle for longer than `health_check_after` seconds are pinged
+    with `SELECT 1` on checkout and replaced if the ping fails. Callers wait
+    for an idle connection or a free slot: discarding a broken connection
+    frees its slot, so a waiter opens a new one instead of timing out.
+    """
+
+    def __init__(
+        self,
+        factory: Callable = get_connection,
+        size: int = POOL_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        health_check_after: float = HEALTH_CHECK_AFTER,
+    ):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._idle: List[Tuple[object, float]] = []  # (connection, last used), most recent last
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except db_errors():
+            return False
+
+    def _free_slot(self) -> None:
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except db_errors():
+            pass
+        self._free_slot()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No SQL connection available after {self.timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    # take the slot now; the (slow) connect runs outside the lock
+                    self._created += 1
+                    conn = None
+
+            if conn is None:
+                try:
+                    return self.factory()
+                except Exception:
+                    self._free_slot()
+                    raise
+
+            if time.monotonic() - last_used < self.health_check_after or self._healthy(conn):
+                return conn
+            logging.info("Dropping stale pooled SQL connection.")
+            self._discard(conn)
+
+    def release(self, conn, broken: bool = False) -> None:
+        if broken:
+            self._discard(conn)
+        else:
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except db_errors():
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+# -----------------------------
+# Data sources
+# -----------------------------
+class DataSource:
+    """A place MarketingCampaign can be read from over a DB-API connection."""
+
+    name = "source"
+
+    def connection(self):
+        """Context manager yielding a DB-API connection."""
+        raise NotImplementedError
+
+    def run(self, fn: Callable):
+        """
+        `fn(conn)` on a connection of this source. A transient error during
+        the query (e.g. a connection dropped mid-fetch) retries it once on a
+        fresh connection: the pool has already discarded the broken one.
+        `fn` must be safe to run twice.
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except db_errors() as e:
+                if attempt or not _is_transient(e):
+                    raise
+                logging.warning("Transient SQL error during a query (%s), retrying once...", e)
+
+    def quote(self, column: str) -> str:
+        return f'"{column}"'
+
+    def stats(self, conn) -> Tuple[int, object]:
+        """(row count, change token) used to fingerprint the table."""
+        raise NotImplementedError
+
+    def change_token(self, conn) -> object:
+        """Something that changes whenever the table does, polled by the refresh scheduler."""
+        return self.stats(conn)
+
+    def head_query(self, n: int) -> str:
+        """SQL for the first `n` rows of the table, limited on the server."""
+        return f"SELECT * FROM {TABLE} LIMIT {int(n)}"
+
+    def size_bytes(self, conn) -> Optional[int]:
+        """Storage used by the database, or None if it cannot be read."""
+        return None
+
+
+class AzureSqlSource(DataSource):
+    name = "Azure SQL"
+
+    def __init__(self):
+        self._pool: Optional[ConnectionPool] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ConnectionPool()
+            return self._pool
+
+    def connection(self):
+        return self.pool.connection()
+
+    def quote(self, column: str) -> str:
+        return f"[{column}]"
+
+    def head_query(self, n: int) -> str:
+        return f"SELECT TOP {int(n)} * FROM {TABLE}"
+
+    def stats(self, conn) -> Tuple[int, object]:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM {TABLE}")
+        count, checksum = cursor.fetchone()
+        cursor.close()
+        return int(count), checksum
+
+    def change_token(self, conn) -> object:
+        # row count and last write time from the DMVs: metadata only, where
+        # stats() scans the whole table for its checksum. Both need VIEW
+        # DATABASE STATE; without it this falls back to stats().
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT (SELECT SUM(row_count) FROM sys.dm_db_partition_stats"
+                " WHERE object_id = OBJECT_ID(?) AND index_id < 2),"
+                " (SELECT MAX(last_user_update) FROM sys.dm_db_index_usage_stats"
+                " WHERE database_id = DB_ID() AND object_id = OBJECT_ID(?))",
+                TABLE, TABLE,
+            )
+            count, updated = cursor.fetchone()
+            cursor.close()
+        except db_errors():
+            return self.stats(conn)
+        if count is None:
+            return self.stats(conn)
+        return int(count), str(updated)
+
+    def size_bytes(self, conn) -> Optional[int]:
+        # needs VIEW DATABASE STATE; without it the size is just not reported
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT SUM(reserved_page_count) * 8192 FROM sys.dm_db_partition_stats")
+            size = cursor.fetchone()[0]
+            cursor.close()
+        except db_errors():
+            return None
+        return int(size) if size is not None else None
+
+
+class _LocalFileSource(DataSource):
+    """Local file source; the change token is the file's mtime and size."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def stats(self, conn) -> Tuple[int, object]:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+        count = cursor.fetchone()[0]
+        cursor.close()
+        st = os.stat(self.path)
+        return int(count), f"{st.st_mtime_ns}:{st.st_size}"
+
+    def size_bytes(self, conn) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return None
+
+
+class SqliteSource(_LocalFileSource):
+    name = "SQLite"
+
+    def _connect(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No local database at {self.path}; see synthetic_data.py")
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+
+class DuckDbSource(_LocalFileSource):
+    """DuckDB database file, or a Parquet file exposed as MarketingCampaign."""
+
+    name = "DuckDB"
+
+    def _connect(self):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("duckdb is required for the duckdb data source.") from e
+
+        if self.path.endswith(".parquet"):
+            conn = duckdb.connect()
+            # DDL takes no bound parameters, so the path goes in as an escaped literal
+            path = self.path.replace("'", "''")
+            conn.execute(f"CREATE VIEW {TABLE} AS SELECT * FROM read_parquet('{path}')")
+            return conn
+        return duckdb.connect(self.path, read_only=True)
+
+
+_source: Optional[DataSource] = None
+_source_lock = threading.Lock()
+
+
+def make_source(kind: str = DATA_SOURCE, path: str = LOCAL_DB_PATH) -> DataSource:
+    if kind == "azure":
+        return AzureSqlSource()
+    if kind == "sqlite":
+        return SqliteSource(path)
+    if kind == "duckdb":
+        return DuckDbSource(path)
+    raise ValueError(f"Unknown data source: {kind}")
+
+
+def get_source() -> DataSource:
+    """Process-wide data source chosen by MARKETPULSE_DATA_SOURCE."""
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = make_source()
+        return _source
+
+
+def set_source(source: DataSource) -> None:
+    """Swap the process-wide source (benchmarks, offline runs)."""
+    global _source
+    with _source_lock:
+        _source = source
@@ -0,0 +1,76 @@
+"""
+eda_profile.py
+Dataset statistics behind the Data Analyst report, computed once per data
+version instead of on every rerun. Per-column distributions are only
+computed the first time a column is selected, then kept with the profile.
+"""
+
+import threading
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from plot_data import ColumnDistribution, column_distribution
+
+
+class DatasetProfile:
+    """
+    Summary statistics of one data version: shape, column kinds, missing
+    values, duplicate rows, dtypes and the numeric correlation matrix.
+    `memo()` keeps anything else derived from the same version (such as
+    column distributions) until the next version replaces it.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: str):
+        self.version = version
+        self.rows, self.cols = df.shape
+
+        numeric = df.select_dtypes(include=np.number)
+        self.numeric_columns = list(numeric.columns)
+        self.categorical_columns = [c for c in df.columns if c not in set(self.numeric_columns)]
+
+        self.missing = df.isna().sum()
+        self.duplicates = int(df.duplicated().sum())
+        self.dtypes = df.dtypes
+        self.corr = numeric.corr() if numeric.shape[1] > 1 else None
+
+        # a shallow reference, for distributions computed later
+        self._df = df
+        self._memo: Dict[object, object] = {}
+        # re-entrant: a memoised build may itself read other memoised values
+        self._lock = threading.RLock()
+
+    def summary(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Metric": ["Rows", "Columns", "Numeric Columns", "Categorical Columns", "Missing Values", "Duplicate Rows"],
+            "Value": [
+                self.rows,
+                self.cols,
+                len(self.numeric_columns),
+                len(self.categorical_columns),
+                int(self.missing.sum()),
+                self.duplicates,
+            ],
+        })
+
+    def missing_table(self) -> pd.DataFrame:
+        table = self.missing.reset_index().rename(columns={"index": "Column", 0: "Missing Count"})
+        table["Missing %"] = (table["Missing Count"] / self.rows * 100).round(2) if self.rows else 0.0
+        return table
+
+    def memo(self, key, build: Callable[[], object]):
+        """Return `build()`, computed once per profile (and so per data version)."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = build()
+            return self._memo[key]
+
+    def distribution(self, column: str) -> ColumnDistribution:
+        """Histogram + KDE (numeric) or value counts (other) of one column, computed on first use."""
+        return self.memo(("distribution", column), lambda: column_distribution(self._df[column]))
+
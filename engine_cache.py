@@ -0,0 +1,179 @@
+"""
+engine_cache.py
+Versioned, TTL-based cache for the analytics engine's data snapshot.
+One instance in analytics_engine.py replaces the old module globals and the
+per-session st.cache_data copies in dashboards.py.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+import pandas as pd
+
+# With Copy-on-Write, shallow copies of the cached frame can be handed to every
+# caller: a caller's writes never reach the shared data. pandas >= 3 always does this.
+if int(pd.__version__.split(".")[0]) == 2:
+    pd.set_option("mode.copy_on_write", True)
+
+
+class Memo:
+    """
+    Values derived from one snapshot on first use (dataset profile, table
+    index, chart samples), so they live and die with the snapshot's frame.
+    """
+
+    def __init__(self):
+        self._values: Dict[object, object] = {}
+        # re-entrant: a build may itself read other memoised values
+        self._lock = threading.RLock()
+
+    def get(self, key, build: Callable[[], object]):
+        """Return `build()`, computed once per snapshot."""
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = build()
+            return self._values[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class EngineSnapshot(NamedTuple):
+    """Everything the engine serves for one data version. Treat as read-only."""
+    df: pd.DataFrame
+    model: object
+    cube: object
+    version: str
+    loaded_at: float
+    # role -> view model (see view_models.py)
+    views: Optional[Dict[str, object]] = None
+    # the source's change token when this snapshot was loaded, if it has one
+    token: Optional[str] = None
+    # derived on first use; shared by copies made with _replace()
+    memo: Optional[Memo] = None
+
+
+class _Flight:
+    """One in-progress load that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[EngineSnapshot] = None
+        self.error: Optional[BaseException] = None
+
+
+class EngineCache:
+    """
+    Holds the current EngineSnapshot.
+
+    - `ttl`: seconds after which the snapshot is stale. A stale snapshot is
+      still served while a background thread revalidates it
+      (stale-while-revalidate); only an empty cache blocks the caller.
+    - `invalidate()`: mark the snapshot stale (soft) or drop it (hard).
+    - Loads are single-flight: however many session threads ask at once,
+      one loader runs and the rest wait for its result (or keep getting the
+      previous snapshot, if there is one).
+    """
+
+    def __init__(self, loader: Callable[[], EngineSnapshot], ttl: float):
+        self.loader = loader
+        self.ttl = ttl
+        self._snapshot: Optional[EngineSnapshot] = None
+        self._expired = False
+        self._inflight: Optional[_Flight] = None
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def get(self, force: bool = False) -> EngineSnapshot:
+        snapshot = self._snapshot
+
+        if force or snapshot is None:
+            return self._load()
+
+        if self._is_stale(snapshot):
+            self._revalidate_in_background()
+
+        return snapshot
+
+    def peek(self) -> Optional[EngineSnapshot]:
+        """Current snapshot without triggering a load."""
+        return self._snapshot
+
+    def _is_stale(self, snapshot: EngineSnapshot) -> bool:
+        return self._expired or (time.time() - snapshot.loaded_at) > self.ttl
+
+    # -----------------------------
+    # Loading
+    # -----------------------------
+    def _load(self) -> EngineSnapshot:
+        with self._lock:
+            flight = self._inflight
+            leader = flight is None
+            if leader:
+                flight = self._inflight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self.loader()
+            self._publish(flight.result)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight = None
+            flight.done.set()
+
+    def _publish(self, snapshot: EngineSnapshot) -> None:
+        # a single reference swap, so readers see either the old or the new snapshot
+        self._snapshot = snapshot
+        self._expired = False
+
+    def _revalidate_in_background(self) -> None:
+        if self._inflight is not None:
+            return
+
+        def run():
+            try:
+                self._load()
+            except Exception:
+                logging.exception("Background refresh failed, keeping the stale snapshot.")
+
+        threading.Thread(target=run, name="engine-cache-refresh", daemon=True).start()
+
+    # -----------------------------
+    # Invalidation / introspection
+    # -----------------------------
+    def invalidate(self, hard: bool = False) -> None:
+        """
+        Soft: the next read serves the current snapshot and refreshes it in
+        the background. Hard: the next read blocks on a fresh load.
+        """
+        if hard:
+            self._snapshot = None
+        self._expired = True
+
+    def info(self) -> Dict[str, object]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "age_seconds": time.time() - snapshot.loaded_at if snapshot else None,
+            "ttl_seconds": self.ttl,
+            "stale": self._is_stale(snapshot) if snapshot else True,
+            "refreshing": self._inflight is not None,
+        }
@@ -0,0 +1,134 @@
+"""
+figure_cache.py
+Process-wide cache of rendered charts, shared by all sessions. Plotly
+figures are kept as their JSON spec and Matplotlib figures as PNG bytes,
+keyed by chart name, parameters and data version. Entries are evicted
+least recently used first once the cache is over its byte budget
+(MARKETPULSE_FIGURE_CACHE_MB).
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Union
+
+import metrics
+
+FIGURE_CACHE_MB = float(os.getenv("MARKETPULSE_FIGURE_CACHE_MB", "64"))
+
+# Matplotlib charts are rendered at this DPI: it fits Streamlit's widest
+# content column, so st.image sends the PNG as it is instead of decoding
+# and resizing it on every rerun.
+PNG_DPI = 140
+
+# charts built from constant data (no data version)
+STATIC = "static"
+
+Entry = Union[str, bytes]
+
+
+class FigureCache:
+    """
+    LRU map of key -> serialised figure with a total size budget in bytes.
+    Builds run outside the lock, so a slow chart never blocks reads of
+    others; two sessions missing the same key at once may both build it.
+    """
+
+    def __init__(self, budget_bytes: float):
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Entry]) -> Entry:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Entry) -> None:
+        size = len(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = value
+            self._bytes += size
+            # the newest entry stays even when it alone is over budget
+            while self._bytes > self.budget_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+            nbytes, entries = self._bytes, len(self._entries)
+
+        metrics.REGISTRY.set_gauge("figure_cache_bytes", nbytes, "Bytes held by the figure cache.")
+        metrics.REGISTRY.set_gauge("figure_cache_entries", entries, "Figures held by the figure cache.")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+CACHE = FigureCache(FIGURE_CACHE_MB * 2**20)
+
+
+def _key(kind: str, chart: str, version: str, params: Optional[Dict[str, Hashable]]) -> Hashable:
+    return kind, chart, version, tuple(sorted((params or {}).items()))
+
+
+def plotly_figure(chart: str, version: str, build: Callable[[], object],
+                  params: Optional[Dict[str, Hashable]] = None):
+    """
+    Plotly figure `build()` for this chart, parameters and data version,
+    rebuilt from its cached JSON spec when there is one.
+    """
+    import plotly.io as pio
+
+    def render() -> str:
+        logging.debug("Building figure %s (%s).", chart, version)
+        return pio.to_json(build(), validate=False)
+
+    return pio.from_json(CACHE.get_or_build(_key("plotly", chart, version, params), render))
+
+
+def png(chart: str, version: str, build: Callable[[], object],
+        params: Optional[Dict[str, Hashable]] = None) -> bytes:
+    """PNG of the Matplotlib figure `build()` for this chart, parameters and data version."""
+    def render() -> bytes:
+        import io
+
+        import matplotlib.pyplot as plt
+
+        logging.debug("Rendering figure %s (%s).", chart, version)
+        fig = build()
+        buf = io.BytesIO()
+        try:
+            fig.savefig(buf, format="png", bbox_inches="tight", dpi=PNG_DPI)
+        finally:
+            plt.close(fig)
+        return buf.getvalue()
+
+    return CACHE.get_or_build(_key("png", chart, version, params), render)
@@ -0,0 +1,289 @@
+"""
+metrics.py
+In-process metrics for the refresh path and the engine getters.
+Stages are timed with `stage(...)`, getters with `@timed`; everything lands in
+one registry that is logged, shown on the Admin dashboard and can be scraped
+in Prometheus text format (MARKETPULSE_METRICS_PORT starts a /metrics server).
+"""
+
+import functools
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+PROCESS_START = time.time()
+
+STAGE_HISTORY = int(os.getenv("MARKETPULSE_METRICS_HISTORY", "200"))
+METRICS_PORT = os.getenv("MARKETPULSE_METRICS_PORT")
+
+PREFIX = "marketpulse_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def rss_bytes() -> int:
+    """Current resident set size; the process peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_by_type() -> Dict[str, int]:
+    """
+    Resident memory split into private (anon), file-backed and shared-memory
+    bytes. File-backed pages, such as a memory-mapped snapshot, are shared by
+    every process mapping the same file. Empty where /proc is unavailable.
+    """
+    kinds = {"RssAnon": "anon", "RssFile": "file", "RssShmem": "shmem"}
+    out: Dict[str, int] = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in kinds:
+                    out[kinds[key]] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return {}
+    return out
+
+
+def uptime_seconds() -> float:
+    return time.time() - PROCESS_START
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of summaries (count + sum) and gauges keyed by metric
+    name and labels, plus a bounded history of stage records for the UI.
+    """
+
+    def __init__(self, history: int = STAGE_HISTORY):
+        self._summaries: Dict[Tuple[str, Labels], List[float]] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._stages: Deque[Dict[str, object]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            entry = self._summaries.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += value
+            if help:
+                self._help.setdefault(name, help)
+
+    def set_gauge(self, name: str, value: float, help: str = "", **labels) -> None:
+        with self._lock:
+            self._gauges[self._key(name, labels)] = float(value)
+            if help:
+                self._help.setdefault(name, help)
+
+    def gauge(self, name: str, **labels) -> Optional[float]:
+        return self._gauges.get(self._key(name, labels))
+
+    def gauges(self, name: str) -> Dict[str, float]:
+        """{first label value: value} for every series of a gauge."""
+        with self._lock:
+            return {labels[0][1] if labels else "": v for (n, labels), v in self._gauges.items() if n == name}
+
+    def summaries(self, name: str) -> Dict[str, Tuple[int, float]]:
+        """{first label value: (count, sum)} for every series of a summary."""
+        with self._lock:
+            return {
+                labels[0][1] if labels else "": (int(c), t)
+                for (n, labels), (c, t) in self._summaries.items() if n == name
+            }
+
+    def record_stage(self, record: Dict[str, object]) -> None:
+        with self._lock:
+            self._stages.append(record)
+
+    def stages(self) -> List[Dict[str, object]]:
+        """Recent stage records, newest first."""
+        with self._lock:
+            return list(reversed(self._stages))
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        self.set_gauge("process_uptime_seconds", uptime_seconds(), "Seconds since the process started.")
+        self.set_gauge("process_resident_memory_bytes", rss_bytes(), "Resident memory of the process.")
+        for kind, value in memory_by_type().items():
+            self.set_gauge("process_resident_memory_by_type_bytes", value,
+                           "Resident memory of the process by kind (anon, file, shmem).", type=kind)
+
+        def fmt(labels: Labels) -> str:
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        with self._lock:
+            summaries = sorted(self._summaries.items())
+            gauges = sorted(self._gauges.items())
+            help_text = dict(self._help)
+
+        lines: List[str] = []
+        seen = set()
+        for (name, labels), (count, total) in summaries:
+            full = PREFIX + name
+            if full not in seen:
+                seen.add(full)
+                if name in help_text:
+                    lines.append(f"# HELP {full} {help_text[name]}")
+                lines.append(f"# TYPE {full} summary")
+            lines.append(f"{full}_count{fmt(labels)} {count}")
+            lines.append(f"{full}_sum{fmt(labels)} {total:.6f}")
+
+        for (name, labels), value in gauges:
+            full = PREFIX + name
+            if full not in seen:
+                seen.add(full)
+                if name in help_text:
+                    lines.append(f"# HELP {full} {help_text[name]}")
+                lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full}{fmt(labels)} {value!r}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Stage:
+    """Handle yielded by `stage()`; report the output shape with `frame()`."""
+
+    def __init__(self):
+        self.rows: Optional[int] = None
+        self.cols: Optional[int] = None
+
+    def frame(self, obj) -> None:
+        shape = getattr(obj, "shape", None)
+        if shape:
+            self.rows = int(shape[0])
+            self.cols = int(shape[1]) if len(shape) > 1 else 1
+
+
+@contextmanager
+def stage(name: str, registry: MetricsRegistry = REGISTRY):
+    """
+    Time one pipeline stage and record duration, output rows/columns and the
+    RSS change across it:
+
+        with metrics.stage("sql_fetch") as s:
+            raw = read(...)
+            s.frame(raw)
+    """
+    handle = _Stage()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield handle
+    finally:
+        duration = time.perf_counter() - start
+        rss_delta = rss_bytes() - rss_before
+
+        registry.observe("stage_duration_seconds", duration, "Pipeline stage wall time.", stage=name)
+        registry.set_gauge("stage_last_duration_seconds", duration, "Last wall time of each stage.", stage=name)
+        registry.set_gauge("stage_rss_delta_bytes", rss_delta, "RSS change over the last run of each stage.", stage=name)
+        if handle.rows is not None:
+            registry.set_gauge("stage_rows", handle.rows, "Rows output by the last run of each stage.", stage=name)
+            registry.set_gauge("stage_columns", handle.cols, "Columns output by the last run of each stage.", stage=name)
+
+        registry.record_stage({
+            "stage": name,
+            "at": time.time(),
+            "seconds": duration,
+            "rows": handle.rows,
+            "cols": handle.cols,
+            "rss_delta_mb": rss_delta / 2**20,
+        })
+        shape = f", {handle.rows} rows x {handle.cols} cols" if handle.rows is not None else ""
+        logging.info("Stage %s: %.3fs%s, RSS %+.1f MB.", name, duration, shape, rss_delta / 2**20)
+
+
+def timed(fn: Callable) -> Callable:
+    """
+    Record the wall time of every call to an engine getter, and the shape of
+    what it returned. Getters run on every rerun, so they only log at DEBUG.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        duration = time.perf_counter() - start
+
+        REGISTRY.observe("getter_duration_seconds", duration, "Analytics engine getter wall time.", getter=name)
+        shape = getattr(result[0] if isinstance(result, tuple) else result, "shape", None)
+        if shape:
+            REGISTRY.set_gauge("getter_rows", shape[0], "Rows returned by the last call of each getter.", getter=name)
+            REGISTRY.set_gauge(
+                "getter_columns", shape[1] if len(shape) > 1 else 1,
+                "Columns returned by the last call of each getter.", getter=name,
+            )
+        logging.debug("Getter %s: %.2f ms.", name, duration * 1000)
+        return result
+
+    return wrapper
+
+
+# -----------------------------
+# /metrics endpoint
+# -----------------------------
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port: Optional[int] = None) -> bool:
+    """
+    Serve REGISTRY on http://0.0.0.0:<port>/metrics from a daemon thread.
+    Safe to call on every Streamlit rerun; only the first call binds.
+    """
+    global _server
+    if port is None:
+        if not METRICS_PORT:
+            return False
+        port = int(METRICS_PORT)
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        except OSError as e:
+            # another Streamlit process on this host already serves the port
+            logging.warning("Metrics server not started on port %s: %s", port, e)
+            return False
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+
+    logging.info("Serving metrics on :%s/metrics", port)
+    return True
@@ -0,0 +1,218 @@
+"""
+parallel.py
+Opt-in process-pool execution for the row-wise parts of a refresh
+(MARKETPULSE_WORKERS > 1). Large arrays reach the workers through
+multiprocessing.shared_memory instead of being pickled. Rows are split on
+fixed boundaries and per-range results are combined in order, so the output
+matches the serial path whatever the worker count.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WORKERS = int(os.getenv("MARKETPULSE_WORKERS", "1"))
+# below this many rows the pool costs more than it saves
+MIN_PARALLEL_ROWS = int(os.getenv("MARKETPULSE_PARALLEL_MIN_ROWS", "250000"))
+
+Spec = Tuple[str, Tuple[int, ...], str]
+
+
+def enabled(n_rows: int) -> bool:
+    return WORKERS > 1 and n_rows >= MIN_PARALLEL_ROWS
+
+
+class SharedArray:
+    """
+    A NumPy array backed by a named shared-memory block. The creating process
+    owns (and unlinks) it; workers `attach` to it by `spec`.
+    """
+
+    def __init__(self, shape: Sequence[int], dtype, name: Optional[str] = None):
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        # workers share the parent's resource tracker, so attaching does not
+        # register a second owner; only the creator unlinks
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def copy_of(cls, arr: np.ndarray) -> "SharedArray":
+        shared = cls(arr.shape, arr.dtype)
+        shared.array[...] = arr
+        return shared
+
+    @classmethod
+    def attach(cls, spec: Spec) -> "SharedArray":
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    @property
+    def spec(self) -> Spec:
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self) -> None:
+        # views into the buffer must be gone before it is closed
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def row_ranges(n_rows: int, step: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + step, n_rows)) for start in range(0, n_rows, step)]
+
+
+# -----------------------------
+# Executor
+# -----------------------------
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker(threads: int) -> None:
+    # WORKERS processes share the cores; keep BLAS/OpenMP inside each from oversubscribing
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by all parallel stages, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # forkserver/spawn: forking a threaded Streamlit process is not safe
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            threads = max(1, (os.cpu_count() or 1) // WORKERS)
+            _executor = ProcessPoolExecutor(
+                WORKERS,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+            logging.info("Started %d refresh worker processes (%s).", WORKERS, method)
+        return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+# -----------------------------
+# Null fill + feature sums
+# -----------------------------
+def _fill_and_sum_task(block_spec: Spec, fills: np.ndarray, groups: List[List[int]],
+                       sums_spec: Spec, start: int, stop: int) -> np.ndarray:
+    block, sums = SharedArray.attach(block_spec), SharedArray.attach(sums_spec)
+    try:
+        rows = block.array[start:stop]
+        missing = np.isnan(rows)
+        np.copyto(rows, np.broadcast_to(fills, rows.shape), where=missing)
+        for g, columns in enumerate(groups):
+            sums.array[start:stop, g] = rows[:, columns].sum(axis=1)
+        del rows
+        return missing.any(axis=0)
+    finally:
+        block.close()
+        sums.close()
+
+
+def fill_and_sum(block: np.ndarray, fills: np.ndarray, groups: List[List[int]]):
+    """
+    Fill NaNs in the 2-D float block with per-column `fills` (in place) and
+    sum each group of columns per row. Returns (columns that had NaNs, sums).
+    """
+    n = len(block)
+    step = -(-n // (WORKERS * 4))
+    with SharedArray.copy_of(block) as shared, SharedArray((n, len(groups)), np.float64) as sums:
+        tasks = [
+            (shared.spec, fills, groups, sums.spec, start, stop)
+            for start, stop in row_ranges(n, step)
+        ]
+        flags = list(get_executor().map(_fill_and_sum_task, *zip(*tasks)))
+        block[...] = shared.array
+        out = sums.array.copy()
+    return np.logical_or.reduce(flags), out
+
+
+# -----------------------------
+# Cluster assignment
+# -----------------------------
+def _assign_task(x_spec: Spec, centers: np.ndarray, labels_spec: Spec, start: int, stop: int) -> float:
+    from segmentation import squared_distances
+
+    X, labels = SharedArray.attach(x_spec), SharedArray.attach(labels_spec)
+    try:
+        d = squared_distances(X.array[start:stop], centers)
+        chunk_labels = d.argmin(axis=1)
+        labels.array[start:stop] = chunk_labels
+        return float(d[np.arange(len(chunk_labels)), chunk_labels].sum())
+    finally:
+        X.close()
+        labels.close()
+
+
+def assign(X: np.ndarray, centers: np.ndarray, step: int) -> Tuple[np.ndarray, List[float]]:
+    """
+    Nearest centroid per row of a dense matrix, in `step`-row ranges (the
+    serial chunk size, so each range is computed exactly as it is serially).
+    Returns (labels, nearest-distance sum per range, in order).
+    """
+    n = len(X)
+    with SharedArray.copy_of(X) as shared, SharedArray((n,), np.int32) as labels:
+        tasks = [(shared.spec, centers, labels.spec, start, stop) for start, stop in row_ranges(n, step)]
+        nearest = list(get_executor().map(_assign_task, *zip(*tasks)))
+        out = labels.array.copy()
+    return out, nearest
+
+
+# -----------------------------
+# KMeans restarts
+# -----------------------------
+def _kmeans_task(X, n_clusters: int, seed: int):
+    from segmentation import kmeans_run
+
+    if isinstance(X, tuple):
+        shared = SharedArray.attach(X)
+        try:
+            return kmeans_run(shared.array, n_clusters, seed)
+        finally:
+            shared.close()
+    return kmeans_run(X, n_clusters, seed)
+
+
+def kmeans_restarts(X, n_clusters: int, seeds: Sequence[int]) -> list:
+    """
+    One single-init KMeans per seed, each in its own worker; results come back
+    in seed order. Dense matrices are shared, sparse ones are pickled.
+    """
+    if isinstance(X, np.ndarray):
+        with SharedArray.copy_of(X) as shared:
+            return list(get_executor().map(_kmeans_task, [shared.spec] * len(seeds),
+                                           [n_clusters] * len(seeds), seeds))
+    return list(get_executor().map(_kmeans_task, [X] * len(seeds), [n_clusters] * len(seeds), seeds))
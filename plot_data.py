@@ -0,0 +1,117 @@
+"""
+plot_data.py
+Chart-ready data whose size does not depend on the row count: histograms
+and KDE curves on a fixed grid (a binned KDE, one O(n) pass per column),
+and stratified samples for point-based charts. Each is computed once per
+column and data version; the charts then draw a constant number of points.
+"""
+
+import os
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+MAX_BINS = int(os.getenv("MARKETPULSE_EDA_MAX_BINS", "100"))
+KDE_GRID_POINTS = int(os.getenv("MARKETPULSE_KDE_GRID", "512"))
+SAMPLE_POINTS = int(os.getenv("MARKETPULSE_SAMPLE_POINTS", "5000"))
+# every stratum keeps at least this many points (or all of its rows)
+MIN_STRATUM_POINTS = 50
+
+
+class ColumnDistribution(NamedTuple):
+    """
+    Chart-ready distribution of one column. Numeric columns have histogram
+    `counts` over `edges` and a KDE curve scaled to the counts (empty when
+    the column is constant); other columns have `counts` per `labels`.
+    """
+    column: str
+    numeric: bool
+    counts: np.ndarray
+    edges: Optional[np.ndarray] = None
+    labels: Optional[List[str]] = None
+    kde_x: Optional[np.ndarray] = None
+    kde_y: Optional[np.ndarray] = None
+
+
+# -----------------------------
+# Histograms + KDE
+# -----------------------------
+def binned_kde(values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """
+    Gaussian KDE (Scott's bandwidth, as scipy and seaborn use) of `values`
+    evaluated on the evenly spaced `grid`, which must span the values.
+    Values are linearly binned onto the grid and the counts convolved with
+    the kernel, so the cost is one pass over the values plus O(grid^2).
+    """
+    n, g = len(values), len(grid)
+    step = grid[1] - grid[0]
+    bandwidth = values.std(ddof=1) * n ** (-1 / 5)
+    if not bandwidth > 0:
+        return np.zeros(g)
+
+    # linear binning: each value splits its weight between its two grid neighbours
+    pos = np.clip((values - grid[0]) / step, 0, g - 1)
+    left = np.minimum(pos.astype(np.int64), g - 2)
+    frac = pos - left
+    counts = np.bincount(left, 1 - frac, minlength=g) + np.bincount(left + 1, frac, minlength=g)
+
+    # offsets past the grid's span cannot land on it
+    reach = min(int(np.ceil(4 * bandwidth / step)), g - 1)
+    offsets = np.arange(-reach, reach + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    return np.convolve(counts, kernel)[reach:reach + g] / n
+
+
+def numeric_distribution(column: str, values: np.ndarray) -> ColumnDistribution:
+    """Histogram ('auto' bins, at most MAX_BINS) and KDE scaled to the bar heights."""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return ColumnDistribution(column, True, np.zeros(0, dtype=np.int64), np.zeros(1))
+
+    edges = np.histogram_bin_edges(values, "auto")
+    if len(edges) > MAX_BINS + 1:
+        edges = np.linspace(edges[0], edges[-1], MAX_BINS + 1)
+    counts, edges = np.histogram(values, edges)
+
+    # as sns.histplot(kde=True): no cut beyond the data, scaled to counts per bin
+    kde_x = kde_y = np.zeros(0)
+    lo, hi = values.min(), values.max()
+    if lo < hi:
+        kde_x = np.linspace(lo, hi, KDE_GRID_POINTS)
+        kde_y = binned_kde(values, kde_x) * len(values) * (edges[1] - edges[0])
+
+    return ColumnDistribution(column, True, counts, edges, kde_x=kde_x, kde_y=kde_y)
+
+
+def column_distribution(s: pd.Series) -> ColumnDistribution:
+    """Histogram + KDE for numeric columns, value counts for the rest."""
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return numeric_distribution(str(s.name), s.to_numpy(dtype=np.float64, na_value=np.nan))
+    counts = s.value_counts()
+    return ColumnDistribution(str(s.name), False, counts.to_numpy(), labels=list(map(str, counts.index)))
+
+
+# -----------------------------
+# Stratified samples
+# -----------------------------
+def stratified_positions(strata: pd.Series, n: int = SAMPLE_POINTS, seed: int = 0) -> np.ndarray:
+    """
+    Row positions of a sample of about `n` rows, allocated to each stratum
+    in proportion to its size (at least MIN_STRATUM_POINTS, so small
+    segments stay visible). Sorted, and the same for the same data and seed.
+    """
+    total = len(strata)
+    if total <= n:
+        return np.arange(total)
+
+    codes, _ = pd.factorize(strata, use_na_sentinel=False)
+    sizes = np.bincount(codes)
+    quota = np.minimum(sizes, np.maximum(np.round(n * sizes / total).astype(np.int64), MIN_STRATUM_POINTS))
+
+    # a random order within each stratum; keep each stratum's first `quota` rows
+    order = np.lexsort((np.random.default_rng(seed).random(total), codes))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.arange(total) - np.repeat(starts, sizes)
+    return np.sort(order[rank < np.repeat(quota, sizes)])
+
@@ -0,0 +1,208 @@
+"""
+preprocessing.py
+Declarative cleaning + feature engineering for MarketingCampaign frames.
+Fill values and clip bounds are learned in batched NumPy passes over the
+numeric block and kept on the fitted Preprocessor, so the same transform
+can clean delta rows and score new customers.
+"""
+
+import warnings
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import parallel
+
+
+class Preprocessor:
+    """
+    `fit_transform(raw)` learns and applies the cleaning steps;
+    `transform(raw)` re-applies them with the learned values.
+    The steps are configured by the class attributes below.
+    """
+
+    index_column = "ID"
+    drop_columns = ["Z_CostContact", "Z_Revenue"]
+
+    birth_year_column = "Year_Birth"
+    age_range = (18, 100)
+    date_column = "Dt_Customer"
+
+    # derived column -> (operation, source column patterns); patterns match case-insensitively
+    features: Dict[str, Tuple[str, List[str]]] = {
+        "TotalSpend": ("sum", ["Mnt*"]),
+        "TotalPurchases": ("sum", ["*Purchases"]),
+        "FamilySize": ("sum", ["Kidhome", "Teenhome"]),
+        "IsParent": ("any", ["Kidhome", "Teenhome"]),
+        "AcceptedAnyCampaign": ("any", ["AcceptedCmp*", "Response"]),
+    }
+    # only derived when every pattern matches a column; the others are 0 without any source
+    require_all_sources = ["FamilySize", "IsParent"]
+
+    clip_columns = ["Income", "TotalSpend"]
+    clip_quantiles = (0.01, 0.99)
+
+    def __init__(self, extra_drop_columns: Optional[List[str]] = None):
+        self.extra_drop_columns = list(extra_drop_columns or [])
+        self.income_fill: Optional[float] = None
+        self.date_fill: Optional[pd.Timestamp] = None
+        self.fill_values: Dict[str, object] = {}
+        self.feature_sources: Dict[str, List[str]] = {}
+        self.clip_bounds: Dict[str, Tuple[float, float]] = {}
+        self.fitted = False
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._run(df, fit=True)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.fitted:
+            raise RuntimeError("Preprocessor.transform() called before fit_transform().")
+        return self._run(df, fit=False)
+
+    # -----------------------------
+    # Steps
+    # -----------------------------
+    @staticmethod
+    def _nanmedian(block: np.ndarray) -> np.ndarray:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+            return np.nanmedian(block, axis=0)
+
+    def _run(self, df: pd.DataFrame, fit: bool) -> pd.DataFrame:
+        if self.index_column in df.columns:
+            df = df.set_index(self.index_column)
+
+        with metrics.stage("cleaning") as s:
+            # Missing Income (filled before the age filter, as the median is over all rows)
+            income = df["Income"].to_numpy(dtype=np.float64)
+            if fit:
+                self.income_fill = float(self._nanmedian(income[:, None])[0])
+            if np.isnan(income).any():
+                df["Income"] = df["Income"].fillna(self.income_fill)
+
+            # Drop junk columns
+            junk = self.drop_columns + self.extra_drop_columns
+            df = df.drop(columns=[c for c in junk if c in df.columns])
+
+            # Compute age
+            today = pd.Timestamp("today")
+            df["Age"] = today.year - df[self.birth_year_column]
+            low, high = self.age_range
+            keep = df["Age"].between(low, high).to_numpy()
+            if not keep.all():
+                df = df[keep]
+
+            # Parse customer date
+            if self.date_column in df.columns:
+                dates = df[self.date_column]
+                if not pd.api.types.is_datetime64_any_dtype(dates):
+                    dates = pd.to_datetime(dates, errors="coerce")
+                if fit:
+                    modes = dates.mode()
+                    self.date_fill = modes.iloc[0] if len(modes) else today
+                dates = dates.fillna(self.date_fill)
+                df["Customer_Tenure"] = (today - dates).dt.days
+                df = df.drop(columns=[self.date_column])
+            s.frame(df)
+
+        with metrics.stage("null_fill") as s:
+            # Fill nulls: one 2-D pass over the numeric block
+            num_cols = list(df.select_dtypes(include="number").columns)
+            block = df[num_cols].to_numpy(dtype=np.float64)
+            if fit:
+                self.fill_values = dict(zip(num_cols, self._nanmedian(block).tolist()))
+
+            # source columns of each derived feature, as positions in the block
+            if fit:
+                self.feature_sources = {}
+                for name, (op, patterns) in self.features.items():
+                    hits = [{c for c in num_cols if fnmatchcase(c.lower(), p.lower())} for p in patterns]
+                    if name in self.require_all_sources and not all(hits):
+                        hits = []
+                    self.feature_sources[name] = [c for c in num_cols if any(c in h for h in hits)]
+            position = {c: j for j, c in enumerate(num_cols)}
+            groups = {
+                name: [position[c] for c in self.feature_sources.get(name, []) if c in position]
+                for name in self.features
+            }
+            skipped = {
+                name for name in self.require_all_sources
+                if not groups.get(name) or len(groups[name]) < len(self.feature_sources[name])
+            }
+            groups = {name: cols for name, cols in groups.items() if cols and name not in skipped}
+
+            presummed = None
+            if parallel.enabled(len(block)):
+                # one pass per row range in the worker pool fills the block and sums the feature sources
+                fills = np.array([self.fill_values.get(c, np.nan) for c in num_cols], dtype=np.float64)
+                had_missing, sums = parallel.fill_and_sum(block, fills, list(groups.values()))
+                presummed = dict(zip(groups, sums.T))
+                for j in np.flatnonzero(had_missing):
+                    col = num_cols[j]
+                    df[col] = df[col].fillna(self.fill_values.get(col, np.nan))
+            else:
+                missing = np.isnan(block)
+                for j in np.flatnonzero(missing.any(axis=0)):
+                    col = num_cols[j]
+                    value = self.fill_values.get(col, np.nan)
+                    block[missing[:, j], j] = value
+                    df[col] = df[col].fillna(value)
+                del missing
+
+            cat_cols = df.select_dtypes(include=["object", "string", "category"]).columns
+            for col in cat_cols:
+                if fit:
+                    modes = df[col].mode()
+                    self.fill_values[col] = modes.iloc[0] if len(modes) else None
+                value = self.fill_values.get(col)
+                if value is None or not df[col].isna().any():
+                    continue
+                if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+                    df[col] = df[col].cat.add_categories([value])
+                df[col] = df[col].fillna(value)
+            s.frame(df)
+
+        with metrics.stage("feature_engineering") as s:
+            # Feature engineering, straight from the filled block
+            derived: Dict[str, np.ndarray] = {}
+            for name, (op, _) in self.features.items():
+                if name in skipped:
+                    continue
+                columns = groups.get(name)
+                if columns is None:
+                    total, dtype = np.zeros(len(df)), np.dtype(np.float64)
+                else:
+                    total = presummed[name] if presummed is not None else block[:, columns].sum(axis=1)
+                    dtype = np.result_type(*[df[num_cols[j]].dtype for j in columns])
+                if op == "any":
+                    derived[name] = (total > 0).astype(int)
+                else:
+                    derived[name] = total.astype(np.int64 if dtype.kind in "iub" else dtype)
+            del block, presummed
+
+            for name, values in derived.items():
+                df[name] = values
+            s.frame(df)
+
+        with metrics.stage("outlier_clipping") as s:
+            # outlier handling: all quantiles in one call
+            clip_cols = [c for c in self.clip_columns if c in df.columns]
+            if clip_cols:
+                if fit:
+                    stacked = np.column_stack([df[c].to_numpy(dtype=np.float64) for c in clip_cols])
+                    lows, highs = np.nanquantile(stacked, list(self.clip_quantiles), axis=0)
+                    self.clip_bounds = {c: (float(lows[j]), float(highs[j])) for j, c in enumerate(clip_cols)}
+                    del stacked
+                for col in clip_cols:
+                    low, high = self.clip_bounds[col]
+                    df[col] = df[col].clip(lower=low, upper=high)
+            s.frame(df)
+
+        self.fitted = self.fitted or fit
+        return df
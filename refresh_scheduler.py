@@ -0,0 +1,196 @@
+"""
+refresh_scheduler.py
+Background refresh, so user reruns only ever read a ready snapshot.
+
+The scheduler calls `refresh` on an interval, and earlier when `probe` (a
+cheap change token: the source's, or the snapshot manifest's) returns
+something new. analytics_engine runs one in a daemon thread; run this module
+to refresh the on-disk snapshot from a separate worker process (or cron):
+
+    python refresh_scheduler.py            # loop forever
+    python refresh_scheduler.py --once     # one refresh, e.g. from cron
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+
+# thread: the app refreshes itself in a background thread
+# worker: a separate refresh_scheduler.py process writes snapshots; the app only reloads them
+# off:    load lazily on the first request, as before
+REFRESH_MODE = os.getenv("MARKETPULSE_REFRESH_MODE", "thread")
+REFRESH_INTERVAL = float(os.getenv("MARKETPULSE_REFRESH_INTERVAL", "900"))
+SOURCE_POLL_INTERVAL = float(os.getenv("MARKETPULSE_SOURCE_POLL", "300"))
+
+
+class RefreshScheduler:
+    """
+    Runs `refresh()` every `interval` seconds (0 = never on a timer) and
+    whenever `probe()` changes, checked every `poll` seconds (0 = never).
+    `trigger()` asks for a refresh now. A failed refresh is logged and
+    retried at the next poll.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[], object],
+        probe: Optional[Callable[[], Optional[str]]] = None,
+        interval: float = REFRESH_INTERVAL,
+        poll: float = SOURCE_POLL_INTERVAL,
+        name: str = "refresh-scheduler",
+    ):
+        self.refresh = refresh
+        self.probe = probe
+        self.interval = interval
+        self.poll = poll if probe is not None else 0.0
+        self.name = name
+        self._token: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_refresh: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.next_refresh: Optional[float] = None
+        self.refreshes = 0
+
+    # -----------------------------
+    # Control
+    # -----------------------------
+    def start(self) -> "RefreshScheduler":
+        """Start the daemon thread; the first refresh runs immediately."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self) -> None:
+        """Refresh as soon as possible (e.g. from the Admin dashboard)."""
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def info(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "last_refresh": self.last_refresh,
+            "next_refresh": self.next_refresh,
+            "last_error": self.last_error,
+            "refreshes": self.refreshes,
+        }
+
+    # -----------------------------
+    # Loop
+    # -----------------------------
+    def _check_probe(self) -> Optional[str]:
+        try:
+            return self.probe()
+        except Exception as e:
+            logging.warning("Refresh probe failed: %s", e)
+            return None
+
+    def refresh_once(self) -> bool:
+        # the token is read before refreshing, so a change during the refresh
+        # shows up as a new token at the next poll
+        token = self._check_probe() if self.probe is not None else None
+        try:
+            self.refresh()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logging.exception("Scheduled refresh failed.")
+            return False
+
+        if token is not None:
+            self._token = token
+        self.last_refresh = time.time()
+        self.last_error = None
+        self.refreshes += 1
+        metrics.REGISTRY.set_gauge(
+            "last_refresh_timestamp_seconds", self.last_refresh, "Time of the last scheduled refresh.",
+            scheduler=self.name,
+        )
+        return True
+
+    def run_forever(self) -> None:
+        now = time.time()
+        next_refresh = now
+        next_poll = now + self.poll if self.poll > 0 else float("inf")
+
+        while not self._stop.is_set():
+            now = time.time()
+            due = self._wake.is_set() or now >= next_refresh
+
+            if not due and now >= next_poll:
+                next_poll = now + self.poll
+                token = self._check_probe()
+                if token is not None and token != self._token:
+                    logging.info("Source changed, refreshing.")
+                    due = True
+
+            if due:
+                self._wake.clear()
+                ok = self.refresh_once()
+                now = time.time()
+                if ok and self.interval > 0:
+                    next_refresh = now + self.interval
+                elif ok:
+                    next_refresh = float("inf")
+                else:
+                    next_refresh = now + (self.poll or self.interval or 60.0)
+                self.next_refresh = next_refresh if next_refresh != float("inf") else None
+
+            wait = min(next_refresh, next_poll) - time.time()
+            if wait > 0:
+                self._wake.wait(None if wait == float("inf") else wait)
+
+
+# -----------------------------
+# Probes
+# -----------------------------
+def source_token() -> str:
+    """Change token of the source table (metadata only, where the source has it)."""
+    from data_sources import get_source
+
+    source = get_source()
+    return str(source.run(source.change_token))
+
+
+def snapshot_token() -> Optional[str]:
+    """Fingerprint of the snapshot on disk, as written by a refresh worker."""
+    import snapshot_store
+
+    manifest = snapshot_store.read_manifest()
+    return f"{manifest['fingerprint']}:{manifest['created_at']}" if manifest else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the MarketPulse snapshot outside the app.")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL)
+    parser.add_argument("--poll", type=float, default=SOURCE_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from data_pipeline import load_and_cluster_data
+
+    scheduler = RefreshScheduler(
+        load_and_cluster_data, source_token, args.interval, args.poll, name="refresh-worker"
+    )
+    if args.once:
+        raise SystemExit(0 if scheduler.refresh_once() else 1)
+    metrics.start_http_server()
+    scheduler.run_forever()
@@ -0,0 +1,352 @@
+"""
+segmentation.py
+Fit-once, predict-many customer segmentation.
+The fitted model keeps everything needed to score new or changed customers:
+the dummy-column schema, fill values, scaler statistics and centroids.
+"""
+
+import os
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import parallel
+
+N_CLUSTERS = 4
+
+# "kmeans" fits on the whole encoded matrix; "minibatch" streams it in chunks
+# through MiniBatchKMeans.partial_fit, so it never has to fit in memory at once.
+BACKEND = os.getenv("MARKETPULSE_CLUSTER_BACKEND", "kmeans")
+BATCH_ROWS = int(os.getenv("MARKETPULSE_CLUSTER_BATCH_ROWS", "100000"))
+MINIBATCH_EPOCHS = int(os.getenv("MARKETPULSE_MINIBATCH_EPOCHS", "2"))
+
+# Above this many dummy columns the one-hot block is kept as a sparse matrix.
+SPARSE_MIN_DUMMIES = int(os.getenv("MARKETPULSE_SPARSE_MIN_DUMMIES", "64"))
+
+# Refit policy: refit on a schedule, or earlier if new data drifts away from the centroids.
+REFIT_INTERVAL_DAYS = float(os.getenv("MARKETPULSE_REFIT_DAYS", "7"))
+DRIFT_THRESHOLD = float(os.getenv("MARKETPULSE_DRIFT_THRESHOLD", "1.25"))
+
+# KMeans restarts with seeds random_state, random_state + 1, ...; the best
+# inertia wins. With MARKETPULSE_WORKERS > 1 they run in parallel.
+KMEANS_RESTARTS = int(os.getenv("MARKETPULSE_KMEANS_RESTARTS", "1"))
+
+
+def squared_distances(X, centers: np.ndarray) -> np.ndarray:
+    """Squared euclidean distance of every row to every centroid."""
+    c = centers.astype(np.float32)
+    # anything but an ndarray is a scipy.sparse matrix
+    if not isinstance(X, np.ndarray):
+        sq = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        cross = np.asarray(X @ c.T)
+    else:
+        sq = np.einsum("ij,ij->i", X, X)
+        cross = X @ c.T
+    d = sq[:, None] - 2.0 * cross + (c * c).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+def kmeans_run(X, n_clusters: int, seed: int) -> Tuple[float, np.ndarray, np.ndarray]:
+    """One single-init KMeans fit: (inertia, centers, labels)."""
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=n_clusters, random_state=seed, n_init=1).fit(X)
+    return float(kmeans.inertia_), kmeans.cluster_centers_, kmeans.labels_
+
+
+class SegmentationModel:
+    """
+    Standard scaling + KMeans over the one-hot encoded customer frame.
+    Cluster IDs are ordered by mean TotalSpend (0 = highest), so the segment
+    labels in analytics_engine stay attached to the same kind of customer
+    across refits.
+
+    The model matrix is built once per frame (or chunk) as a C-contiguous
+    float32 array and scaled in place. With many dummy columns the one-hot
+    block is a CSR matrix scaled without centering; KMeans distances do not
+    change under that shift, so the clustering is the same.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int = N_CLUSTERS,
+        random_state: int = 42,
+        backend: str = BACKEND,
+        batch_rows: int = BATCH_ROWS,
+        restarts: int = KMEANS_RESTARTS,
+    ):
+        if backend not in ("kmeans", "minibatch"):
+            raise ValueError(f"Unknown clustering backend: {backend}")
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.backend = backend
+        self.batch_rows = batch_rows
+        self.restarts = restarts
+        self.numeric: List[str] = []
+        self.dummies: List[Tuple[str, List[object]]] = []
+        self.columns: List[str] = []
+        self.sparse = False
+        self.fill_values: Optional[np.ndarray] = None
+        self.mean_: Optional[np.ndarray] = None
+        self.scale_: Optional[np.ndarray] = None
+        self.cluster_centers_: Optional[np.ndarray] = None
+        self.labels_: Optional[np.ndarray] = None
+        self.baseline_distance: float = 0.0
+        self.fitted_at: float = 0.0
+        self.pipeline_version: Optional[str] = None
+
+    # -----------------------------
+    # Encoding
+    # -----------------------------
+    def _chunks(self, df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+        for start in range(0, len(df), self.batch_rows):
+            yield df.iloc[start:start + self.batch_rows]
+
+    def _fit_schema(self, df: pd.DataFrame) -> None:
+        """
+        Same columns and fill values `pd.get_dummies(df, drop_first=True)` would
+        give, worked out from the compact frame without encoding it.
+        """
+        frame = df.drop(columns=["Cluster"], errors="ignore")
+        to_encode = frame.select_dtypes(include=["object", "string", "category"]).columns
+        self.numeric = [c for c in frame.columns if c not in to_encode]
+
+        self.dummies = []
+        for col in to_encode:
+            if isinstance(frame[col].dtype, pd.CategoricalDtype):
+                levels = list(frame[col].cat.categories)
+            else:
+                levels = sorted(frame[col].dropna().unique())
+            if len(levels) > 1:
+                self.dummies.append((col, levels[1:]))
+
+        dummy_names = [f"{col}_{v}" for col, levels in self.dummies for v in levels]
+        self.columns = self.numeric + dummy_names
+        self.sparse = len(dummy_names) >= SPARSE_MIN_DUMMIES
+
+        # one column at a time: a float64 copy of the whole numeric block would
+        # be several times the size of the float32 model matrix
+        medians = np.zeros(len(self.numeric))
+        for j, col in enumerate(self.numeric):
+            values = frame[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            values = values[np.isfinite(values)]
+            if len(values):
+                medians[j] = np.median(values)
+        self.fill_values = medians.astype(np.float32)
+
+    def _raw_matrix(self, df: pd.DataFrame):
+        """
+        Unscaled model matrix: one float32 array (dense) or a
+        (numeric float32 array, one-hot CSR) pair (sparse).
+        """
+        n, n_num = len(df), len(self.numeric)
+        n_dummy = len(self.columns) - n_num
+        width = n_num if self.sparse else n_num + n_dummy
+        X = np.zeros((n, width), dtype=np.float32)
+
+        for j, col in enumerate(self.numeric):
+            if col in df.columns:
+                X[:, j] = df[col].to_numpy(dtype=np.float32, na_value=np.nan)
+            else:
+                X[:, j] = np.nan
+        bad_rows, bad_cols = np.nonzero(~np.isfinite(X[:, :n_num]))
+        X[bad_rows, bad_cols] = self.fill_values[bad_cols]
+
+        rows, cols = [], []
+        offset = 0
+        for col, levels in self.dummies:
+            if col in df.columns:
+                # position of each value among the fitted levels; -1 for
+                # NULLs and levels the model has not seen
+                codes = pd.Index(levels).get_indexer(df[col])
+                hit = np.flatnonzero(codes >= 0)
+                rows.append(hit)
+                cols.append(offset + codes[hit])
+            offset += len(levels)
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+
+        if not self.sparse:
+            X[rows, n_num + cols] = 1.0
+            return X
+
+        from scipy import sparse
+
+        onehot = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n, n_dummy)
+        )
+        return X, onehot
+
+    def _fit_scaler(self, matrices) -> None:
+        """Mean / std (ddof=0) per column, accumulated in float64 over chunks."""
+        count, total, squares = 0, 0.0, 0.0
+        for M in matrices:
+            dense, onehot = M if self.sparse else (M, None)
+            s = dense.sum(axis=0, dtype=np.float64)
+            q = np.einsum("ij,ij->j", dense, dense, dtype=np.float64)
+            if onehot is not None:
+                ones = np.asarray(onehot.sum(axis=0), dtype=np.float64).ravel()
+                s, q = np.concatenate([s, ones]), np.concatenate([q, ones])
+            count, total, squares = count + dense.shape[0], total + s, squares + q
+
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+        std[std < 1e-12] = 1.0
+        self.mean_, self.scale_ = mean, std
+
+    def _scale(self, M):
+        """Scale a raw matrix in place; returns what KMeans consumes."""
+        n_num = len(self.numeric)
+        if not self.sparse:
+            M -= self.mean_.astype(np.float32)
+            M /= self.scale_.astype(np.float32)
+            return M
+
+        from scipy import sparse
+
+        dense, onehot = M
+        dense -= self.mean_[:n_num].astype(np.float32)
+        dense /= self.scale_[:n_num].astype(np.float32)
+        onehot.data /= self.scale_[n_num:].astype(np.float32)[onehot.indices]
+        return sparse.hstack([sparse.csr_matrix(dense), onehot], format="csr")
+
+    def _matrix(self, df: pd.DataFrame):
+        return self._scale(self._raw_matrix(df))
+
+    # -----------------------------
+    # Fit / predict
+    # -----------------------------
+    def fit(self, df: pd.DataFrame) -> "SegmentationModel":
+        self._fit_schema(df)
+
+        if self.backend == "minibatch":
+            centers, labels, baseline = self._fit_minibatch(df)
+        else:
+            centers, labels, baseline = self._fit_kmeans(df)
+
+        # order clusters by mean TotalSpend, highest first
+        if "TotalSpend" in df.columns:
+            spend = df["TotalSpend"].to_numpy(dtype=np.float64)
+            means = np.array([spend[labels == k].mean() if (labels == k).any() else -np.inf
+                              for k in range(self.n_clusters)])
+            order = np.argsort(-means, kind="stable")
+        else:
+            order = np.arange(self.n_clusters)
+        self.cluster_centers_ = centers[order]
+        rank = np.empty(self.n_clusters, dtype=np.int32)
+        rank[order] = np.arange(self.n_clusters)
+        self.labels_ = rank[labels]
+
+        self.baseline_distance = baseline
+        self.fitted_at = time.time()
+        return self
+
+    def _fit_kmeans(self, df: pd.DataFrame):
+        with metrics.stage("encoding") as s:
+            M = self._raw_matrix(df)
+            s.rows, s.cols = len(df), len(self.columns)
+
+        with metrics.stage("scaling") as s:
+            self._fit_scaler([M])
+            X = self._scale(M)
+            s.frame(X)
+        del M
+
+        with metrics.stage("kmeans") as s:
+            s.frame(X)
+            if self.restarts <= 1:
+                from sklearn.cluster import KMeans
+
+                kmeans = KMeans(n_clusters=self.n_clusters, random_state=self.random_state, n_init="auto")
+                labels = kmeans.fit_predict(X)
+                return kmeans.cluster_centers_, labels, float(kmeans.inertia_ / X.shape[0])
+
+            seeds = [self.random_state + i for i in range(self.restarts)]
+            if parallel.enabled(X.shape[0]):
+                runs = parallel.kmeans_restarts(X, self.n_clusters, seeds)
+            else:
+                runs = [kmeans_run(X, self.n_clusters, seed) for seed in seeds]
+
+        # lowest inertia; ties go to the earlier seed
+        best = min(range(len(runs)), key=lambda i: runs[i][0])
+        inertia, centers, labels = runs[best]
+        return centers, labels, inertia / X.shape[0]
+
+    def _fit_minibatch(self, df: pd.DataFrame):
+        # chunks are encoded on the fly, so encoding is timed with the pass it feeds
+        with metrics.stage("scaling") as s:
+            self._fit_scaler(self._raw_matrix(chunk) for chunk in self._chunks(df))
+            s.rows, s.cols = len(df), len(self.columns)
+
+        from sklearn.cluster import MiniBatchKMeans
+
+        kmeans = MiniBatchKMeans(
+            n_clusters=self.n_clusters,
+            random_state=self.random_state,
+            batch_size=min(self.batch_rows, 4096),
+            n_init=3,
+        )
+        with metrics.stage("kmeans") as s:
+            for _ in range(MINIBATCH_EPOCHS):
+                for chunk in self._chunks(df):
+                    kmeans.partial_fit(self._matrix(chunk))
+            s.rows, s.cols = len(df), len(self.columns)
+
+        # final labelling pass against the converged centroids
+        self.cluster_centers_ = kmeans.cluster_centers_
+        labels, nearest = self._assign_chunks(df)
+        return kmeans.cluster_centers_, labels, nearest
+
+    def _distances(self, X) -> np.ndarray:
+        return squared_distances(X, self.cluster_centers_)
+
+    def _assign_chunks(self, df: pd.DataFrame):
+        # in parallel the dense matrix is built whole; the minibatch backend
+        # exists to avoid that, so it always assigns chunk by chunk
+        if parallel.enabled(len(df)) and not self.sparse and self.backend == "kmeans":
+            labels, sums = parallel.assign(self._matrix(df), self.cluster_centers_, self.batch_rows)
+            nearest = 0.0
+            for chunk_sum in sums:
+                nearest += chunk_sum
+            return labels, nearest / len(df)
+
+        labels, nearest = [], 0.0
+        for chunk in self._chunks(df):
+            d = self._distances(self._matrix(chunk))
+            chunk_labels = d.argmin(axis=1)
+            nearest += float(d[np.arange(len(chunk_labels)), chunk_labels].sum())
+            labels.append(chunk_labels.astype(np.int32))
+        return np.concatenate(labels), nearest / len(df)
+
+    def assign(self, df: pd.DataFrame):
+        """Return (labels, drift) in one pass; drift is the mean distance to the
+        nearest centroid relative to the one seen at fit time."""
+        if not len(df):
+            return np.empty(0, dtype=np.int32), 1.0
+        with metrics.stage("cluster_assignment") as s:
+            labels, nearest = self._assign_chunks(df)
+            s.rows, s.cols = len(df), len(self.columns)
+        drift = float(nearest / self.baseline_distance) if self.baseline_distance > 0 else 1.0
+        return labels, drift
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        return self.assign(df)[0]
+
+    def fit_predict(self, df: pd.DataFrame) -> np.ndarray:
+        return self.fit(df).labels_
+
+    # -----------------------------
+    # Refit policy
+    # -----------------------------
+    def is_due(self) -> bool:
+        """True when the scheduled refit interval has passed."""
+        if self.cluster_centers_ is None:
+            return True
+        return time.time() - self.fitted_at > REFIT_INTERVAL_DAYS * 86400
+
+    @staticmethod
+    def has_drifted(drift: float) -> bool:
+        return drift > DRIFT_THRESHOLD
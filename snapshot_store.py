@@ -0,0 +1,227 @@
+"""
+snapshot_store.py
+Local columnar snapshots of the cleaned + clustered customer frame.
+Used by data_pipeline.py to skip SQL and KMeans on cold starts.
+
+With MARKETPULSE_SHARED_SNAPSHOT=1 the frame is served straight from the
+memory-mapped Arrow file as read-only column views, so every app process on
+the host shares one copy in the page cache instead of holding its own.
+
+Several processes may share one snapshot directory: files are written under
+unique temporary names and renamed into place, writers take `writer_lock()`,
+and the frame and artifacts carry the fingerprint they were built for, so a
+reader never pairs files from two different snapshots.
+"""
+
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialised
+    fcntl = None
+
+import pandas as pd
+
+SNAPSHOT_DIR = os.getenv("MARKETPULSE_SNAPSHOT_DIR", ".snapshots")
+SHARED_SNAPSHOT = os.getenv("MARKETPULSE_SHARED_SNAPSHOT", "0") == "1"
+
+FRAME_FILE = "customers.arrow"
+ARTIFACTS_FILE = "artifacts.pkl"
+MANIFEST_FILE = "manifest.json"
+MODEL_FILE = "segmentation_model.pkl"
+VIEWS_FILE = "views.pkl"
+LOCK_FILE = "refresh.lock"
+
+# Arrow schema metadata key holding the frame's fingerprint
+FINGERPRINT_KEY = b"marketpulse.fingerprint"
+
+
+def _path(name: str, snapshot_dir: Optional[str] = None) -> str:
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, name)
+
+
+def _temp_path(path: str) -> str:
+    """A new, unique temporary file next to `path` (each writer gets its own)."""
+    fd, tmp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                               dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    return tmp
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = _temp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextmanager
+def writer_lock(snapshot_dir: Optional[str] = None):
+    """
+    Exclusive lock on the snapshot directory, held while a process refreshes
+    and writes a snapshot. Processes that missed the same fingerprint wait
+    here, then load the snapshot the first one wrote instead of rebuilding it.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(snapshot_dir or SNAPSHOT_DIR, exist_ok=True)
+    with open(_path(LOCK_FILE, snapshot_dir), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_manifest(snapshot_dir: Optional[str] = None) -> Optional[Dict]:
+    """Return the manifest of the current snapshot, or None if there is none."""
+    try:
+        with open(_path(MANIFEST_FILE, snapshot_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(
+    df: pd.DataFrame,
+    artifacts: Dict[str, object],
+    fingerprint: str,
+    meta: Optional[Dict] = None,
+    snapshot_dir: Optional[str] = None,
+) -> bool:
+    """
+    Write the frame as an uncompressed Arrow IPC file (so it can be memory-mapped)
+    plus the fitted model artifacts. The manifest is written last, so readers
+    never see a half-written snapshot. `meta` is stored in the manifest as-is.
+    Files are replaced, never rewritten, so processes still mapping the
+    previous frame keep reading it until they reload.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        logging.warning("pyarrow is not installed, snapshot cache disabled.")
+        return False
+
+    os.makedirs(snapshot_dir or SNAPSHOT_DIR, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), FINGERPRINT_KEY: fingerprint.encode()})
+    frame_path = _path(FRAME_FILE, snapshot_dir)
+    tmp = _temp_path(frame_path)
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, frame_path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    _atomic_write(_path(ARTIFACTS_FILE, snapshot_dir),
+                  pickle.dumps({"fingerprint": fingerprint, "artifacts": artifacts}))
+
+    manifest = {
+        "fingerprint": fingerprint,
+        "created_at": time.time(),
+        "rows": int(len(df)),
+        "columns": list(map(str, df.columns)),
+        **(meta or {}),
+    }
+    _atomic_write(_path(MANIFEST_FILE, snapshot_dir), json.dumps(manifest).encode())
+
+    logging.info("Saved snapshot %s (%d rows).", fingerprint[:12], len(df))
+    return True
+
+
+def load_snapshot(
+    fingerprint: str,
+    snapshot_dir: Optional[str] = None,
+    shared: Optional[bool] = None,
+) -> Optional[Tuple[pd.DataFrame, Dict[str, object]]]:
+    """
+    Return (df, artifacts) if a snapshot for `fingerprint` exists, else None.
+    The Arrow file is memory-mapped, so loading costs little more than the
+    pandas conversion. `shared` (default SHARED_SNAPSHOT) skips the conversion
+    copy: columns stay read-only views of the mapped file.
+    """
+    if shared is None:
+        shared = SHARED_SNAPSHOT
+
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or manifest.get("fingerprint") != fingerprint:
+        return None
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+
+    try:
+        source = pa.memory_map(_path(FRAME_FILE, snapshot_dir), "r")
+        table = pa.ipc.open_file(source).read_all()
+        with open(_path(ARTIFACTS_FILE, snapshot_dir), "rb") as f:
+            saved = pickle.load(f)
+    except (OSError, pa.ArrowInvalid, pickle.UnpicklingError, EOFError) as e:
+        logging.warning("Ignoring unreadable snapshot: %s", e)
+        return None
+
+    # the files are replaced one at a time: while another process is writing,
+    # the manifest, frame and artifacts can belong to different snapshots
+    frame_fingerprint = (table.schema.metadata or {}).get(FINGERPRINT_KEY, b"").decode()
+    if frame_fingerprint != fingerprint or not isinstance(saved, dict) or saved.get("fingerprint") != fingerprint:
+        logging.info("Snapshot %s is being replaced, not loading it.", fingerprint[:12])
+        return None
+    artifacts = saved["artifacts"]
+
+    # split_blocks keeps one block per column, so no column is copied into
+    # a consolidated 2-D block; numeric columns without nulls map zero-copy
+    df = table.to_pandas(split_blocks=True) if shared else table.to_pandas()
+
+    logging.info("Loaded snapshot %s (%d rows%s).", fingerprint[:12], len(df), ", shared" if shared else "")
+    return df, artifacts
+
+
+def save_model(model: object, snapshot_dir: Optional[str] = None) -> None:
+    """Persist the fitted segmentation model. It outlives individual snapshots."""
+    os.makedirs(snapshot_dir or SNAPSHOT_DIR, exist_ok=True)
+    _atomic_write(_path(MODEL_FILE, snapshot_dir), pickle.dumps(model))
+
+
+def load_model(snapshot_dir: Optional[str] = None) -> Optional[object]:
+    try:
+        with open(_path(MODEL_FILE, snapshot_dir), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+
+
+def save_views(views: Dict[str, object], fingerprint: str, snapshot_dir: Optional[str] = None) -> None:
+    """Persist the per-role view models built from the snapshot `fingerprint`."""
+    os.makedirs(snapshot_dir or SNAPSHOT_DIR, exist_ok=True)
+    _atomic_write(_path(VIEWS_FILE, snapshot_dir), pickle.dumps({"fingerprint": fingerprint, "views": views}))
+
+
+def load_views(fingerprint: str, snapshot_dir: Optional[str] = None) -> Optional[Dict[str, object]]:
+    """View models saved for `fingerprint`, or None (none saved, another version, or unreadable)."""
+    try:
+        with open(_path(VIEWS_FILE, snapshot_dir), "rb") as f:
+            saved = pickle.load(f)
+    # views pickled by an older version of the code may no longer load
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, ImportError):
+        return None
+    if not isinstance(saved, dict) or saved.get("fingerprint") != fingerprint:
+        return None
+    logging.info("Loaded view models %s.", fingerprint[:12])
+    return saved["views"]
@@ -0,0 +1,206 @@
+"""
+synthetic_data.py
+Vectorised generator for MarketingCampaign-shaped data, plus writers for the
+local data sources in data_sources.py.
+
+    python synthetic_data.py --rows 1M --format sqlite --out data/marketing.db
+    MARKETPULSE_DATA_SOURCE=sqlite streamlit run App.py
+
+Rows are generated and written in chunks, so 10M rows never sit in memory at once.
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_sources import TABLE
+
+CHUNK_ROWS = 500_000
+
+EDUCATION = ["Graduation", "PhD", "Master", "2n Cycle", "Basic"]
+EDUCATION_P = [0.50, 0.22, 0.16, 0.09, 0.03]
+MARITAL_STATUS = ["Married", "Together", "Single", "Divorced", "Widow", "Alone", "Absurd", "YOLO"]
+MARITAL_STATUS_P = [0.386, 0.259, 0.214, 0.104, 0.034, 0.0015, 0.0008, 0.0007]
+
+# share of total spend per product line, and the campaigns in table order
+PRODUCTS = {
+    "MntWines": 0.50,
+    "MntFruits": 0.04,
+    "MntMeatProducts": 0.28,
+    "MntFishProducts": 0.06,
+    "MntSweetProducts": 0.04,
+    "MntGoldProds": 0.08,
+}
+CAMPAIGNS = ["AcceptedCmp3", "AcceptedCmp4", "AcceptedCmp5", "AcceptedCmp1", "AcceptedCmp2"]
+
+FIRST_CUSTOMER_DATE = np.datetime64("2012-07-30")
+CUSTOMER_DAYS = 700
+
+
+def generate_marketing_campaign(n_rows: int, seed: int = 0, start_id: int = 1) -> pd.DataFrame:
+    """
+    One MarketingCampaign-shaped frame of `n_rows` customers.
+    Spend and purchases grow with income and fall with children at home, so
+    the clusters look like the ones on the real table. About 1% of Income
+    values are NULL, as in the source.
+    """
+    rng = np.random.default_rng(seed)
+    n = n_rows
+
+    year_birth = np.clip(rng.normal(1969, 12, n), 1940, 2000).astype(np.int16)
+    education = rng.choice(EDUCATION, size=n, p=EDUCATION_P)
+    marital = rng.choice(MARITAL_STATUS, size=n, p=np.asarray(MARITAL_STATUS_P) / sum(MARITAL_STATUS_P))
+
+    income = np.clip(rng.lognormal(10.8, 0.45, n), 1_700, 670_000).round()
+    kidhome = rng.choice(3, size=n, p=[0.58, 0.40, 0.02]).astype(np.int8)
+    teenhome = rng.choice(3, size=n, p=[0.52, 0.46, 0.02]).astype(np.int8)
+    kids = kidhome + teenhome
+
+    # spend propensity: income drives it, kids at home damp it
+    wealth = np.clip((income - 15_000) / 70_000, 0.02, 2.0)
+    propensity = wealth ** 1.8 / (1.0 + 0.8 * kids)
+    total_spend = rng.gamma(2.0, 1.0, n) * 600 * propensity
+
+    mix = rng.dirichlet([v * 20 for v in PRODUCTS.values()], size=n)
+    spend = {col: np.round(total_spend * mix[:, j]).astype(np.int32) for j, col in enumerate(PRODUCTS)}
+
+    activity = 2 + 12 * np.sqrt(propensity)
+    data = {
+        "ID": np.arange(start_id, start_id + n, dtype=np.int64),
+        "Year_Birth": year_birth,
+        "Education": education,
+        "Marital_Status": marital,
+        "Income": income,
+        "Kidhome": kidhome,
+        "Teenhome": teenhome,
+        "Dt_Customer": FIRST_CUSTOMER_DATE + rng.integers(0, CUSTOMER_DAYS, n).astype("timedelta64[D]"),
+        "Recency": rng.integers(0, 100, n).astype(np.int16),
+        **spend,
+        "NumDealsPurchases": np.minimum(rng.poisson(1.0 + 1.5 * kids), 15).astype(np.int16),
+        "NumWebPurchases": np.minimum(rng.poisson(activity * 0.35), 27).astype(np.int16),
+        "NumCatalogPurchases": np.minimum(rng.poisson(activity * 0.22), 28).astype(np.int16),
+        "NumStorePurchases": np.minimum(rng.poisson(activity * 0.5), 13).astype(np.int16),
+        "NumWebVisitsMonth": np.minimum(rng.poisson(7.0 - 3.0 * np.minimum(wealth, 1.0)), 20).astype(np.int16),
+    }
+
+    for col, base in zip(CAMPAIGNS, [0.07, 0.07, 0.07, 0.06, 0.013]):
+        data[col] = (rng.random(n) < base * (0.3 + wealth)).astype(np.int8)
+    data["Complain"] = (rng.random(n) < 0.009).astype(np.int8)
+    data["Z_CostContact"] = np.full(n, 3, dtype=np.int8)
+    data["Z_Revenue"] = np.full(n, 11, dtype=np.int8)
+    data["Response"] = (rng.random(n) < 0.15 * (0.4 + wealth)).astype(np.int8)
+
+    df = pd.DataFrame(data)
+    df.loc[rng.random(n) < 0.01, "Income"] = np.nan
+    return df
+
+
+def iter_chunks(n_rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the table in chunks; each chunk has its own derived seed."""
+    for i, start in enumerate(range(0, n_rows, chunk_rows)):
+        size = min(chunk_rows, n_rows - start)
+        yield generate_marketing_campaign(size, seed=seed * 100_003 + i, start_id=start + 1)
+
+
+# -----------------------------
+# Writers
+# -----------------------------
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def write_sqlite(path: str, n_rows: int, seed: int = 0) -> None:
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        for i, chunk in enumerate(iter_chunks(n_rows, seed)):
+            chunk["Dt_Customer"] = chunk["Dt_Customer"].dt.strftime("%Y-%m-%d")
+            if i == 0:
+                columns = ", ".join(
+                    f'"{c}" {_sql_type(t)}' + (" PRIMARY KEY" if c == "ID" else "")
+                    for c, t in chunk.dtypes.items()
+                )
+                conn.execute(f"CREATE TABLE {TABLE} ({columns})")
+
+            placeholders = ", ".join("?" * len(chunk.columns))
+            rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(f"INSERT INTO {TABLE} VALUES ({placeholders})", rows)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def write_parquet(path: str, n_rows: int, seed: int = 0) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in iter_chunks(n_rows, seed):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_duckdb(path: str, n_rows: int, seed: int = 0) -> None:
+    import duckdb
+
+    conn = duckdb.connect(path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        for i, chunk in enumerate(iter_chunks(n_rows, seed)):
+            conn.register("chunk", chunk)
+            if i == 0:
+                conn.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM chunk")
+            else:
+                conn.execute(f"INSERT INTO {TABLE} SELECT * FROM chunk")
+            conn.unregister("chunk")
+    finally:
+        conn.close()
+
+
+WRITERS = {"sqlite": write_sqlite, "parquet": write_parquet, "duckdb": write_duckdb}
+
+
+def write_dataset(path: str, n_rows: int, fmt: Optional[str] = None, seed: int = 0) -> str:
+    """Write `n_rows` synthetic customers to `path`; the format defaults from the extension."""
+    if fmt is None:
+        fmt = {".parquet": "parquet", ".duckdb": "duckdb"}.get(os.path.splitext(path)[1], "sqlite")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    WRITERS[fmt](path, n_rows, seed)
+    logging.info("Wrote %d synthetic customers to %s (%s).", n_rows, path, fmt)
+    return path
+
+
+def parse_rows(text: str) -> int:
+    """'10k' -> 10_000, '1M' -> 1_000_000, '2500' -> 2500."""
+    text = text.strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic MarketingCampaign table.")
+    parser.add_argument("--rows", default="10k", help="row count, e.g. 10k, 1M, 10M")
+    parser.add_argument("--format", choices=sorted(WRITERS), default=None)
+    parser.add_argument("--out", default="data/marketing.db")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    write_dataset(args.out, parse_rows(args.rows), args.format, args.seed)
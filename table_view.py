@@ -0,0 +1,130 @@
+"""
+table_view.py
+Server-side paging, sorting and filtering of the customer frame for the
+dashboards' table views. Only the requested page of rows is materialised,
+so only that page is serialised to the browser. Sort orders are built once
+per column and data version and shared by all sessions.
+"""
+
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+MAX_PAGE_SIZE = 1000
+# filter masks kept per data version (one bool per row each)
+FILTER_CACHE_SIZE = 16
+
+_COMPARISON = re.compile(r"^\s*(>=|<=|>|<|=)?\s*(-?[\d.]+)\s*$")
+_RANGE = re.compile(r"^\s*(-?[\d.]+)\s*\.\.\s*(-?[\d.]+)\s*$")
+
+
+class TablePage(NamedTuple):
+    """One page of rows plus where it sits in the (filtered) table."""
+    rows: pd.DataFrame
+    total: int
+    page: int
+    pages: int
+    start: int
+
+
+def filter_mask(s: pd.Series, query: str) -> np.ndarray:
+    """
+    Rows of `s` matching `query`. Numeric columns take a number (equality),
+    a comparison (`>100`, `<=3`) or a range (`10..20`, inclusive); other
+    columns match a case-insensitive substring. An unparseable numeric query
+    matches nothing.
+    """
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        values = s.to_numpy()
+        try:
+            m = _RANGE.match(query)
+            if m:
+                return (values >= float(m.group(1))) & (values <= float(m.group(2)))
+            m = _COMPARISON.match(query)
+            if m:
+                op, x = m.group(1) or "=", float(m.group(2))
+                return {
+                    ">": values > x, ">=": values >= x, "<": values < x, "<=": values <= x, "=": values == x,
+                }[op]
+        except ValueError:
+            pass
+        return np.zeros(len(s), dtype=bool)
+
+    needle = query.strip().lower()
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # match the (few) categories, then select rows by code
+        hits = [i for i, c in enumerate(s.cat.categories) if needle in str(c).lower()]
+        return np.isin(s.cat.codes.to_numpy(), hits)
+    return s.astype(str).str.lower().str.contains(needle, regex=False).to_numpy(dtype=bool)
+
+
+class TableIndex:
+    """
+    Sort orders and filter masks over one data version's frame, computed on
+    first use. Orders are row positions, stable, with nulls last.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def order(self, column: str, descending: bool = False) -> np.ndarray:
+        key = (column, descending)
+        order = self._orders.get(key)
+        if order is None:
+            s = self.df[column].reset_index(drop=True)
+            order = s.sort_values(ascending=not descending, kind="stable").index.to_numpy()
+            with self._lock:
+                self._orders[key] = order
+        return order
+
+    def mask(self, column: str, query: str) -> np.ndarray:
+        key = (column, query)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = filter_mask(self.df[column], query)
+            with self._lock:
+                if len(self._masks) >= FILTER_CACHE_SIZE:
+                    self._masks.pop(next(iter(self._masks)))
+                self._masks[key] = mask
+        return mask
+
+    def page(
+        self,
+        page: int = 0,
+        page_size: int = 50,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        filter_column: Optional[str] = None,
+        filter_value: str = "",
+        columns: Optional[List[str]] = None,
+    ) -> TablePage:
+        """Rows of 0-based `page` after filtering and sorting; `page` is clamped to the last page."""
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+        positions = None
+        if sort_by:
+            positions = self.order(sort_by, descending)
+        if filter_column and filter_value.strip():
+            mask = self.mask(filter_column, filter_value)
+            positions = positions[mask[positions]] if positions is not None else np.flatnonzero(mask)
+
+        total = len(self.df) if positions is None else len(positions)
+        pages = max(1, -(-total // page_size))
+        page = min(max(int(page), 0), pages - 1)
+        start = page * page_size
+        stop = min(start + page_size, total)
+
+        if positions is None:
+            rows = self.df.iloc[start:stop]
+        else:
+            rows = self.df.iloc[positions[start:stop]]
+        if columns:
+            rows = rows[[c for c in columns if c in rows.columns]]
+        return TablePage(rows, total, page, pages, start)
+
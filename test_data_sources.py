@@ -0,0 +1,25 @@
+"""
+The DuckDB source, over a database file or a Parquet file, must read the
+same MarketingCampaign frame as SQLite. Skipped without duckdb.
+
+    python -m pytest test_data_sources.py
+"""
+
+import pandas as pd
+import pytest
+
+import synthetic_data
+from data_sources import DuckDbSource, SqliteSource
+
+pytest.importorskip("duckdb")
+
+ROWS = 2000
+
+
+@pytest.mark.parametrize("name", ["marketing.duckdb", "marketing.parquet", "o'brien.parquet"])
+def test_duckdb_matches_sqlite(read_table, tmp_path, name):
+    sqlite_path, path = str(tmp_path / "marketing.db"), str(tmp_path / name)
+    synthetic_data.write_dataset(sqlite_path, ROWS, seed=3)
+    synthetic_data.write_dataset(path, ROWS, seed=3)
+
+    pd.testing.assert_frame_equal(read_table(DuckDbSource(path)), read_table(SqliteSource(sqlite_path)))
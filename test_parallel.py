@@ -0,0 +1,41 @@
+"""
+The process-pool refresh stages (MARKETPULSE_WORKERS > 1) must give exactly
+the serial output: the cleaned frame, the cluster labels and the drift.
+
+    python -m pytest test_parallel.py
+"""
+
+import numpy as np
+import pandas as pd
+
+import parallel
+from data_pipeline import make_preprocessor
+from segmentation import SegmentationModel
+
+
+def refresh(raw: pd.DataFrame):
+    df = make_preprocessor().fit_transform(raw.copy())
+    model = SegmentationModel(restarts=3)
+    labels = model.fit_predict(df)
+    assigned, drift = model.assign(df)
+    return df, labels, assigned, drift, model.cluster_centers_
+
+
+def test_parallel_matches_serial(raw, monkeypatch):
+    monkeypatch.setattr(parallel, "WORKERS", 1)
+    serial = refresh(raw)
+
+    monkeypatch.setattr(parallel, "WORKERS", 3)
+    monkeypatch.setattr(parallel, "MIN_PARALLEL_ROWS", 1)
+    assert parallel.enabled(len(raw))
+    try:
+        pooled = refresh(raw)
+    finally:
+        parallel.shutdown()
+
+    df, labels, assigned, drift, centers = serial
+    pd.testing.assert_frame_equal(pooled[0], df)
+    np.testing.assert_array_equal(pooled[1], labels)
+    np.testing.assert_array_equal(pooled[2], assigned)
+    assert pooled[3] == drift
+    np.testing.assert_array_equal(pooled[4], centers)
@@ -0,0 +1,75 @@
+"""
+Preprocessor must clean a raw MarketingCampaign frame exactly as the
+original clean_frame() did; the reference copy of it below is kept only for
+this comparison.
+
+    python -m pytest test_preprocessing.py
+"""
+
+import pandas as pd
+
+from preprocessing import Preprocessor
+
+
+def reference_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """clean_frame() as it was before the Preprocessor (fit mode)."""
+    df = df.set_index("ID")
+    df["Income"] = df["Income"].fillna(df["Income"].median())
+    df = df.drop(columns=[c for c in ["Z_CostContact", "Z_Revenue"] if c in df.columns])
+
+    df["Age"] = pd.Timestamp("today").year - df["Year_Birth"]
+    df = df[(df["Age"] >= 18) & (df["Age"] <= 100)]
+
+    df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], errors="coerce")
+    df["Dt_Customer"] = df["Dt_Customer"].fillna(df["Dt_Customer"].mode()[0])
+    df["Customer_Tenure"] = (pd.Timestamp("today") - df["Dt_Customer"]).dt.days
+
+    num_cols = df.select_dtypes(include="number").columns
+    cat_cols = df.select_dtypes(include=["object", "category"]).columns
+    fill = {col: df[col].median() for col in num_cols}
+    fill.update({col: df[col].mode()[0] for col in cat_cols})
+    for col in list(num_cols) + list(cat_cols):
+        value = fill[col]
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+        df[col] = df[col].fillna(value)
+
+    df["TotalSpend"] = df[[c for c in df.columns if c.startswith("Mnt")]].sum(axis=1)
+    df["TotalPurchases"] = df[[c for c in df.columns if c.endswith("Purchases")]].sum(axis=1)
+    df["FamilySize"] = df["Kidhome"] + df["Teenhome"]
+    df["IsParent"] = (df["FamilySize"] > 0).astype(int)
+
+    camp_cols = [c for c in df.columns if c.lower().startswith("acceptedcmp")] + ["Response"]
+    df["AcceptedAnyCampaign"] = (df[camp_cols].sum(axis=1) > 0).astype(int)
+
+    for col in ["Income", "TotalSpend"]:
+        low, high = df[col].quantile([0.01, 0.99])
+        df[col] = df[col].clip(lower=low, upper=high)
+
+    return df.drop(columns=["Dt_Customer"])
+
+
+def test_matches_reference_cleaning(raw):
+    expected = reference_clean(raw.copy())
+    cleaned = Preprocessor().fit_transform(raw.copy())
+
+    assert list(cleaned.columns) == list(expected.columns)
+    # dtypes may be narrower now; the values must not change
+    pd.testing.assert_frame_equal(cleaned, expected, check_dtype=False, check_categorical=False)
+
+
+def test_transform_reuses_fitted_values(raw):
+    preprocessor = Preprocessor()
+    fitted = preprocessor.fit_transform(raw.copy())
+
+    # the last rows again, cleaned with the fill values and clip bounds of the whole frame
+    tail = raw.iloc[-500:].copy()
+    pd.testing.assert_frame_equal(preprocessor.transform(tail), fitted.loc[fitted.index.isin(tail["ID"])])
+
+
+def test_family_features_need_both_columns(raw):
+    cleaned = Preprocessor().fit_transform(raw.drop(columns=["Teenhome"]))
+
+    # as in clean_frame(): FamilySize and IsParent need both Kidhome and Teenhome
+    assert "FamilySize" not in cleaned.columns
+    assert "IsParent" not in cleaned.columns
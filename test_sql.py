@@ -1,35 +1,22 @@
-import pyodbc
 import pandas as pd
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from data_sources import get_source
 
-SERVER = "bidemoserver.database.windows.net"
-DATABASE = "MarketingAnalyticsDB"
-USERNAME = "bi-sql-admin"
-PASSWORD = os.getenv("SQL_PASSWORD")
 
 def test_connection():
+    source = get_source()
     try:
-        conn = pyodbc.connect(
-            "DRIVER={ODBC Driver 18 for SQL Server};"
-            f"SERVER={SERVER};"
-            f"DATABASE={DATABASE};"
-            f"UID={USERNAME};"
-            f"PWD={PASSWORD};"
-            "Encrypt=yes;"
-            "TrustServerCertificate=no;"
-            "Connection Timeout=30;"
-        )
+        with source.connection() as conn:
+            print(f"✅ Connected to {source.name}!")
 
-        print("✅ Connected to Azure SQL!")
+            cursor = conn.cursor()
+            cursor.execute(source.head_query(5))
+            columns = [c[0] for c in cursor.description]
+            df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+            cursor.close()
+            print(df)
 
-        df = pd.read_sql("SELECT TOP 5 * FROM MarketingCampaign", conn)
-        print(df)
-
-        conn.close()
-        print("🔌 Connection closed.")
+        print("🔌 Connection released.")
 
     except Exception as e:
         print("❌ Connection failed!")
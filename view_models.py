@@ -0,0 +1,61 @@
+"""
+view_models.py
+Per-role view models: everything a role's pages show, computed once per
+data version when the engine refreshes. Pages only render them, so a rerun
+does no pandas work on the request path. They hold small frames and plain
+values only (never the customer frame), so they pickle into the snapshot
+directory and other app processes can load them instead of rebuilding.
+"""
+
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+
+MANAGER = "Manager"
+MARKETING_ANALYST = "Marketing Analyst"
+DATA_ANALYST = "Data Analyst"
+
+# rows shown by the report's head/tail previews
+PREVIEW_ROWS = 5
+
+
+class ManagerView(NamedTuple):
+    """KPI cards and the revenue chart of the Manager dashboard."""
+    version: str
+    total_customers: int
+    avg_customer_spend: float
+    total_revenue: float
+    accepted_campaign_rate: float
+    revenue_by_segment: pd.DataFrame
+
+
+class MarketingView(NamedTuple):
+    """Segment engagement chart of the Marketing Analyst dashboard."""
+    version: str
+    segment_distribution: pd.DataFrame
+
+
+class DataAnalystView(NamedTuple):
+    """
+    The Data Analyst home, insights, clusters and report pages. `sample`
+    holds the stratified Income/TotalSpend points of the scatter chart (None
+    when those columns are missing); the report's statistics come from the
+    dataset profile. Paged tables and column distributions are still served
+    on demand, since they depend on the user's choices.
+    """
+    version: str
+    rows: int
+    columns: List[str]
+    segment_distribution: pd.DataFrame
+    spend_table: pd.DataFrame
+    cluster_summary: pd.DataFrame
+    cluster_counts: pd.Series
+    sample: Optional[pd.DataFrame]
+    sample_columns: List[str]
+    head: pd.DataFrame
+    tail: pd.DataFrame
+    summary: pd.DataFrame
+    missing: pd.DataFrame
+    dtypes: pd.Series
+    corr: Optional[pd.DataFrame]
+